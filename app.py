@@ -1,46 +1,642 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import jwt
 from datetime import datetime, timedelta
 import hashlib
-from flask import Flask, render_template, jsonify, request, redirect, url_for
-import locale
+import hmac
+from flask import Flask, Response, abort, make_response, render_template, jsonify, request, redirect, send_file, url_for, g
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
+from werkzeug.security import safe_join
 from bson import ObjectId
+from bson.errors import InvalidId
 import json
+import math
+import re
+import unicodedata
+import gzip
+import mimetypes
+import tempfile
+import itertools
+import threading
+import queue
+import time
+import csv
+import io
+import base64
+import uuid
+import atexit
+from functools import lru_cache, wraps
+import click
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
 
 import os
 from os.path import join, dirname
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-dotenv_path = join(dirname(__file__), '.env')
-load_dotenv(dotenv_path)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-MONGODB_URI = os.environ.get("MONGODB_URI")
-DB_NAME =  os.environ.get("DB_NAME")
 
-locale.setlocale(locale.LC_TIME, 'id_ID')
+app = Flask(__name__)
 
-client = MongoClient(MONGODB_URI)
-db = client[DB_NAME]
+# _________________ Konfigurasi ________________________________________________
+
+
+def muat_konfigurasi():
+    # .env baru dibaca saat konfigurasi pertama kali dibutuhkan, bukan saat modul di-import
+    if not app.config.get('KONFIGURASI_DIMUAT'):
+        load_dotenv(join(dirname(__file__), '.env'))
+        app.config.update(
+            SECRET_KEY=os.environ.get("SECRET_KEY"),
+            MONGODB_URI=os.environ.get("MONGODB_URI"),
+            DB_NAME=os.environ.get("DB_NAME"),
+            MONGO_LAMBAT_MS=int(os.environ.get('MONGO_LAMBAT_MS', 100)),
+            METRIK_DEBUG=os.environ.get('METRIK_DEBUG') == '1',
+            METRIK_TOKEN=os.environ.get('METRIK_TOKEN'),
+            METRIK_DIR=os.environ.get('METRIK_DIR'),
+            ANTRIAN_TICK=int(os.environ.get('ANTRIAN_TICK', 15)),
+            ANTRIAN_CHANGE_STREAM=os.environ.get('ANTRIAN_CHANGE_STREAM') == '1',
+            ANTRIAN_ARSIP_RETENSI_HARI=int(os.environ.get('ANTRIAN_ARSIP_RETENSI_HARI', 0)),
+            ANTRIAN_STREAM_MAKS=int(os.environ.get('ANTRIAN_STREAM_MAKS', max(int(os.environ.get('WEB_THREADS', 4)) // 2, 1))),
+            ANTRIAN_STREAM_DETIK=int(os.environ.get('ANTRIAN_STREAM_DETIK', 300)),
+            TUGAS_PEKERJA=int(os.environ.get('TUGAS_PEKERJA', 2)),
+            TUGAS_PULIH_DETIK=int(os.environ.get('TUGAS_PULIH_DETIK', 900)),
+            TUGAS_PULIH_INTERVAL=int(os.environ.get('TUGAS_PULIH_INTERVAL', 300)),
+            KONFIGURASI_DIMUAT=True,
+        )
+    return app.config
+
+# _________________ JSON ________________________________________________
+
+
+def nilai_json(nilai):
+    if isinstance(nilai, ObjectId):
+        return str(nilai)
+    if isinstance(nilai, datetime):
+        # Field tanggal disimpan sebagai datetime tengah malam; cukup kirim tanggalnya
+        if nilai.hour == nilai.minute == nilai.second == nilai.microsecond == 0:
+            return nilai.strftime('%Y-%m-%d')
+        return nilai.isoformat(timespec='seconds')
+    raise TypeError(f'Object of type {type(nilai).__name__} is not JSON serializable')
+
+
+class JSONProviderBSON(DefaultJSONProvider):
+    # ObjectId/datetime langsung di-encode, jadi route tidak perlu mengubahnya
+    # ke string satu per satu. Pakai orjson bila terpasang.
+
+    @staticmethod
+    def default(nilai):
+        try:
+            return nilai_json(nilai)
+        except TypeError:
+            return DefaultJSONProvider.default(nilai)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent') or not kwargs.get('ensure_ascii', True):
+            kwargs.setdefault('default', self.default)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+        ).decode()
+
+
+app.json = JSONProviderBSON(app)
+
+# _________________ Koneksi MongoDB ________________________________________________
+
+_mongo = {'pid': None, 'client': None, 'db': None}
+_mongo_lock = threading.Lock()
+
+
+def opsi_pool_mongo():
+    return {
+        'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 50)),
+        'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+        'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_MS', 60000)),
+        'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+        'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+        'socketTimeoutMS': int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+    }
 
-app = Flask(__name__)
-SECRET_KEY = os.environ.get("SECRET_KEY")
 
-# _________________ Token User ________________________________________________
+def get_db():
+    # MongoClient tidak aman dibawa melewati fork(), jadi setiap proses
+    # worker membuat client (dan pool koneksinya) sendiri saat pertama dipakai.
+    if _mongo['pid'] != os.getpid():
+        with _mongo_lock:
+            if _mongo['pid'] != os.getpid():
+                konfigurasi = muat_konfigurasi()
+                _mongo['client'] = MongoClient(konfigurasi['MONGODB_URI'], event_listeners=[PENDENGAR_MONGO], **opsi_pool_mongo())
+                _mongo['db'] = _mongo['client'][konfigurasi['DB_NAME']]
+                _mongo['pid'] = os.getpid()
+    return _mongo['db']
+
+
+db = LocalProxy(get_db)
+
+# _________________ Metrik ________________________________________________
+
+METRIK_BUCKET_DETIK = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIK_BUCKET_PERINTAH = (0, 1, 2, 5, 10, 20, 50, 100)
+METRIK_INTERVAL = 5
+
+_metrik_lock = threading.Lock()
+_metrik = {
+    'request': {},
+    'perintah': {},
+    'status': {},
+    'mongo': {},
+    'lambat': {},
+}
+# Contoh perintah lambat hanya dari worker yang menjawab, tidak digabung antar proses
+MONGO_LAMBAT = deque(maxlen=50)
+_konteks = threading.local()
+_berkas_metrik = {'pid': None, 'path': None}
+BERKAS_METRIK_MATI = 'metrik-mati.json'
+
+
+def catat_histogram(tabel, label, nilai, bucket):
+    item = tabel.get(label)
+    if item is None:
+        item = tabel[label] = {'bucket': [0] * len(bucket), 'jumlah': 0, 'total': 0}
+    for i, batas in enumerate(bucket):
+        if nilai <= batas:
+            item['bucket'][i] += 1
+    item['jumlah'] += 1
+    item['total'] += nilai
+
+
+def ringkas_perintah(nama, perintah):
+    # Cukup bentuk query-nya saja (tanpa nilai) supaya data user tidak ikut tercatat
+    def bentuk(nilai):
+        if isinstance(nilai, dict):
+            return {k: bentuk(v) for k, v in nilai.items()}
+        if isinstance(nilai, list):
+            return [bentuk(v) for v in nilai[:3]]
+        return '?'
+    ringkas = {'koleksi': perintah.get(nama)}
+    for kunci in ('filter', 'sort', 'pipeline', 'q'):
+        if kunci in perintah:
+            ringkas[kunci] = bentuk(perintah[kunci])
+    return ringkas
+
+
+class PendengarMongo(monitoring.CommandListener):
+    # Event pymongo dipanggil di thread yang menjalankan query,
+    # jadi route yang sedang aktif bisa diambil dari thread-local.
+
+    def started(self, event):
+        if event.command_name in ('find', 'aggregate', 'count', 'update', 'delete', 'findAndModify'):
+            perintah = getattr(_konteks, 'perintah', None)
+            if perintah is not None:
+                perintah[event.request_id] = ringkas_perintah(event.command_name, event.command)
+
+    def succeeded(self, event):
+        self.catat(event)
+
+    def failed(self, event):
+        self.catat(event)
+
+    def catat(self, event):
+        detik = event.duration_micros / 1e6
+        route = getattr(_konteks, 'route', None) or '-'
+        ringkas = (getattr(_konteks, 'perintah', None) or {}).pop(event.request_id, None)
+        if getattr(_konteks, 'route', None):
+            _konteks.jumlah_mongo += 1
+            _konteks.detik_mongo += detik
+        with _metrik_lock:
+            label = (route, event.command_name)
+            item = _metrik['mongo'].setdefault(label, {'jumlah': 0, 'total': 0})
+            item['jumlah'] += 1
+            item['total'] += detik
+            if detik * 1000 >= muat_konfigurasi()['MONGO_LAMBAT_MS']:
+                _metrik['lambat'][label] = _metrik['lambat'].get(label, 0) + 1
+                MONGO_LAMBAT.append({
+                    'waktu': datetime.utcnow().isoformat(timespec='seconds'),
+                    'route': route,
+                    'perintah': event.command_name,
+                    'ms': round(detik * 1000, 1),
+                    'detail': ringkas,
+                })
+
+
+PENDENGAR_MONGO = PendengarMongo()
+
+
+@app.before_request
+def mulai_metrik():
+    muat_konfigurasi()
+    _konteks.route = request.endpoint or '404'
+    _konteks.mulai = time.perf_counter()
+    _konteks.jumlah_mongo = 0
+    _konteks.detik_mongo = 0.0
+    _konteks.perintah = {}
+
+
+@app.after_request
+def catat_metrik(response):
+    if getattr(_konteks, 'route', None) is None:
+        return response
+    berkas_metrik()
+    detik = time.perf_counter() - _konteks.mulai
+    label = (_konteks.route, request.method)
+    with _metrik_lock:
+        catat_histogram(_metrik['request'], label, detik, METRIK_BUCKET_DETIK)
+        catat_histogram(_metrik['perintah'], label, _konteks.jumlah_mongo, METRIK_BUCKET_PERINTAH)
+        status = label + (response.status_code,)
+        _metrik['status'][status] = _metrik['status'].get(status, 0) + 1
+    if muat_konfigurasi()['METRIK_DEBUG']:
+        response.headers['Server-Timing'] = (
+            f'app;dur={detik * 1000:.1f}, '
+            f'mongo;dur={_konteks.detik_mongo * 1000:.1f};desc="{_konteks.jumlah_mongo} perintah"'
+        )
+    return response
+
+
+@app.teardown_request
+def selesai_metrik(exc):
+    _konteks.route = None
+    _konteks.perintah = None
+
+
+def label_prometheus(**label):
+    isi = ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in label.items())
+    return '{' + isi + '}'
+
+
+def tulis_histogram(baris, nama, label, item, bucket):
+    for batas, jumlah in zip(bucket, item['bucket']):
+        baris.append(f'{nama}_bucket{label_prometheus(**label, le=batas)} {jumlah}')
+    baris.append(f'{nama}_bucket{label_prometheus(**label, le="+Inf")} {item["jumlah"]}')
+    baris.append(f'{nama}_sum{label_prometheus(**label)} {item["total"]}')
+    baris.append(f'{nama}_count{label_prometheus(**label)} {item["jumlah"]}')
+
+
+def serialisasi_metrik(metrik):
+    return {jenis: [[list(label), nilai] for label, nilai in tabel.items()] for jenis, tabel in metrik.items()}
+
+
+def snapshot_metrik():
+    with _metrik_lock:
+        return json.dumps(serialisasi_metrik(_metrik))
+
+
+def berkas_metrik():
+    # Dengan beberapa worker gunicorn, setiap worker menulis counter-nya ke
+    # METRIK_DIR secara berkala dan /metrics menjumlahkan semua berkas, jadi
+    # angka tidak naik-turun tergantung worker mana yang kebagian scrape.
+    folder = muat_konfigurasi()['METRIK_DIR']
+    if folder and _berkas_metrik['pid'] != os.getpid():
+        with _metrik_lock:
+            if _berkas_metrik['pid'] != os.getpid():
+                # Nama unik per proses: pid bisa dipakai ulang setelah worker didaur ulang
+                _berkas_metrik['path'] = join(folder, f'metrik-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+                _berkas_metrik['pid'] = os.getpid()
+                threading.Thread(target=tulis_metrik_berkala, name='metrik', daemon=True).start()
+                atexit.register(tulis_metrik)
+    return _berkas_metrik['path'] if folder else None
+
+
+def tulis_metrik():
+    path = berkas_metrik()
+    if path:
+        sementara = f'{path}.tmp'
+        with open(sementara, 'w', encoding='utf-8') as f:
+            f.write(snapshot_metrik())
+        os.replace(sementara, path)
+
+
+def tulis_metrik_berkala():
+    while True:
+        time.sleep(METRIK_INTERVAL)
+        try:
+            tulis_metrik()
+        except OSError as e:
+            app.logger.warning('Metrik gagal ditulis: %s', e)
+
+
+def gabung_metrik(tujuan, data):
+    for jenis, isi in data.items():
+        tabel = tujuan.setdefault(jenis, {})
+        for label, nilai in isi:
+            label = tuple(label)
+            if isinstance(nilai, dict):
+                item = tabel.setdefault(label, {k: [0] * len(v) if isinstance(v, list) else 0 for k, v in nilai.items()})
+                for k, v in nilai.items():
+                    item[k] = [a + b for a, b in zip(item[k], v)] if isinstance(v, list) else item[k] + v
+            else:
+                tabel[label] = tabel.get(label, 0) + nilai
+    return tujuan
 
 
-def get_user_info():
-    token_receive = request.cookies.get("mytoken")
-    user_info = None
-    if token_receive:
+def baca_berkas_metrik(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def lipat_metrik(folder, pid):
+    # Dipanggil master gunicorn (child_exit) setelah worker berhenti: counter
+    # worker itu dipindah ke satu berkas gabungan, jadi jumlah berkas tetap
+    # sebanyak worker yang hidup walau worker terus didaur ulang.
+    tujuan = join(folder, BERKAS_METRIK_MATI)
+    try:
+        lama = baca_berkas_metrik(tujuan)
+    except FileNotFoundError:
+        lama = {}
+    # Berkas yang sudah terlipat tetapi belum sempat dihapus tidak dihitung lagi
+    for nama in lama.pop('terlipat', []):
+        if os.path.exists(join(folder, nama)):
+            os.remove(join(folder, nama))
+    berkas = sorted(nama for nama in os.listdir(folder) if nama.startswith(f'metrik-{pid}-') and nama.endswith('.json'))
+    if not berkas:
+        return
+    gabungan = gabung_metrik({}, lama)
+    for nama in berkas:
         try:
-            payload = jwt.decode(token_receive, SECRET_KEY,algorithms=["HS256"])
-            user_info = db.users.find_one({"nama": payload["id"]})
-        except jwt.ExpiredSignatureError:
-            pass
-        except jwt.exceptions.DecodeError:
-            pass
-    return user_info
+            gabung_metrik(gabungan, baca_berkas_metrik(join(folder, nama)))
+        except (OSError, ValueError) as e:
+            app.logger.warning('Berkas metrik %s dilewati: %s', nama, e)
+    sementara = f'{tujuan}.tmp'
+    with open(sementara, 'w', encoding='utf-8') as f:
+        json.dump(dict(serialisasi_metrik(gabungan), terlipat=berkas), f)
+    os.replace(sementara, tujuan)
+    for nama in berkas:
+        os.remove(join(folder, nama))
+
+
+def kumpulkan_metrik():
+    folder = muat_konfigurasi()['METRIK_DIR']
+    if not folder:
+        return gabung_metrik({}, json.loads(snapshot_metrik()))
+    tulis_metrik()
+    # Counter worker yang sudah berhenti ada di berkas gabungan, jadi tidak turun.
+    # Bila berkas worker hilang di tengah pembacaan berarti sedang dilipat; baca ulang.
+    for _ in range(3):
+        try:
+            gabungan = {}
+            try:
+                mati = baca_berkas_metrik(join(folder, BERKAS_METRIK_MATI))
+            except FileNotFoundError:
+                mati = {}
+            terlipat = set(mati.pop('terlipat', []))
+            gabung_metrik(gabungan, mati)
+            for nama in sorted(os.listdir(folder)):
+                if nama.startswith('metrik-') and nama.endswith('.json') and nama != BERKAS_METRIK_MATI and nama not in terlipat:
+                    try:
+                        gabung_metrik(gabungan, baca_berkas_metrik(join(folder, nama)))
+                    except FileNotFoundError:
+                        raise
+                    except (OSError, ValueError) as e:
+                        app.logger.warning('Berkas metrik %s dilewati: %s', nama, e)
+            return gabungan
+        except FileNotFoundError:
+            continue
+    return gabungan
+
+
+def teks_metrik():
+    metrik = kumpulkan_metrik()
+    request_metrik = metrik.get('request', {})
+    perintah_metrik = metrik.get('perintah', {})
+    status = metrik.get('status', {})
+    mongo = metrik.get('mongo', {})
+    lambat = metrik.get('lambat', {})
+
+    baris = [
+        '# HELP http_request_duration_seconds Lama request per route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (route, method), item in sorted(request_metrik.items()):
+        tulis_histogram(baris, 'http_request_duration_seconds', {'route': route, 'method': method}, item, METRIK_BUCKET_DETIK)
+    baris += [
+        '# HELP http_request_mongo_commands Jumlah perintah MongoDB per request.',
+        '# TYPE http_request_mongo_commands histogram',
+    ]
+    for (route, method), item in sorted(perintah_metrik.items()):
+        tulis_histogram(baris, 'http_request_mongo_commands', {'route': route, 'method': method}, item, METRIK_BUCKET_PERINTAH)
+    baris += [
+        '# HELP http_requests_total Jumlah request per route dan status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (route, method, kode), jumlah in sorted(status.items()):
+        baris.append(f'http_requests_total{label_prometheus(route=route, method=method, status=kode)} {jumlah}')
+    baris += [
+        '# HELP mongo_commands_total Jumlah perintah MongoDB per route.',
+        '# TYPE mongo_commands_total counter',
+    ]
+    for (route, perintah), item in sorted(mongo.items()):
+        baris.append(f'mongo_commands_total{label_prometheus(route=route, command=perintah)} {item["jumlah"]}')
+    baris += [
+        '# HELP mongo_command_seconds_total Total waktu perintah MongoDB per route.',
+        '# TYPE mongo_command_seconds_total counter',
+    ]
+    for (route, perintah), item in sorted(mongo.items()):
+        baris.append(f'mongo_command_seconds_total{label_prometheus(route=route, command=perintah)} {item["total"]:.6f}')
+    baris += [
+        f'# HELP mongo_slow_commands_total Perintah MongoDB yang lebih lama dari {muat_konfigurasi()["MONGO_LAMBAT_MS"]} ms.',
+        '# TYPE mongo_slow_commands_total counter',
+    ]
+    for (route, perintah), jumlah in sorted(lambat.items()):
+        baris.append(f'mongo_slow_commands_total{label_prometheus(route=route, command=perintah)} {jumlah}')
+    for contoh in list(MONGO_LAMBAT)[-10:]:
+        baris.append(f'# lambat {json.dumps(contoh, default=str)}')
+    return '\n'.join(baris) + '\n'
+
+
+def metrik_diizinkan():
+    # Tanpa METRIK_TOKEN, /metrics hanya terbuka bila METRIK_DEBUG dinyalakan
+    konfigurasi = muat_konfigurasi()
+    if konfigurasi['METRIK_TOKEN']:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {konfigurasi['METRIK_TOKEN']}")
+    return konfigurasi['METRIK_DEBUG']
+
+
+@app.route('/metrics')
+def metrics():
+    if not metrik_diizinkan():
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(teks_metrik(), mimetype='text/plain; version=0.0.4')
+
+# _________________ Kompresi Respons ________________________________________________
+
+KOMPRES_MIN = 1024
+KOMPRES_MIMETYPE = ('text/html', 'text/plain', 'text/css', 'text/csv', 'application/json', 'application/javascript', 'image/svg+xml')
+KOMPRES_LEVEL_GZIP = 6
+KOMPRES_LEVEL_BR = 4
+
+
+def pilih_encoding():
+    if brotli is not None and request.accept_encodings.quality('br'):
+        return 'br'
+    if request.accept_encodings.quality('gzip'):
+        return 'gzip'
+    return None
+
+
+def kompres(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=KOMPRES_LEVEL_BR)
+    return gzip.compress(data, compresslevel=KOMPRES_LEVEL_GZIP)
+
+
+@app.after_request
+def kompres_respons(response):
+    # Respons streaming (SSE, ekspor) dan file statis (send_file) dilewati;
+    # aset statis sudah punya versi .gz/.br sendiri.
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in KOMPRES_MIMETYPE):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < KOMPRES_MIN:
+        return response
+
+    encoding = pilih_encoding()
+    if encoding is None:
+        return response
+    response.set_data(kompres(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # ETag kuat hanya berlaku untuk satu representasi; versi terkompresi
+    # memakai ETag lemah agar If-None-Match tetap cocok (304).
+    etag, lemah = response.get_etag()
+    if etag and not lemah:
+        response.set_etag(etag, weak=True)
+    return response
+
+# _________________ Cache LRU ________________________________________________
+
+
+class CacheLRU:
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hit = 0
+        self.miss = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kunci):
+        with self._lock:
+            item = self._data.get(kunci)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[kunci]
+                self.miss += 1
+                return None
+            self._data.move_to_end(kunci)
+            self.hit += 1
+            return item[1]
+
+    def set(self, kunci, nilai, ttl=None):
+        with self._lock:
+            self._data[kunci] = (time.monotonic() + (ttl or self.ttl), nilai)
+            self._data.move_to_end(kunci)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def hapus(self, cocok):
+        with self._lock:
+            for kunci in [kunci for kunci in self._data if cocok(kunci)]:
+                del self._data[kunci]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def info(self):
+        with self._lock:
+            return {'ukuran': len(self._data), 'maks': self.maxsize, 'hit': self.hit, 'miss': self.miss}
+
+
+# _________________ Identitas Per Request ________________________________________________
+
+TOKEN_CACHE = CacheLRU(maxsize=4096, ttl=600)
+IDENTITAS_CACHE = CacheLRU(maxsize=4096, ttl=300)
+
+def get_token_payload():
+    if 'token_payload' not in g:
+        g.token_payload = None
+        token_receive = request.cookies.get("mytoken")
+        if token_receive:
+            payload = TOKEN_CACHE.get(token_receive)
+            if payload is None:
+                try:
+                    payload = jwt.decode(token_receive, muat_konfigurasi()['SECRET_KEY'], algorithms=["HS256"])
+                except jwt.ExpiredSignatureError:
+                    pass
+                except jwt.exceptions.DecodeError:
+                    pass
+                else:
+                    # Jangan simpan lebih lama dari sisa umur token
+                    sisa = min(TOKEN_CACHE.ttl, payload['exp'] - time.time()) if 'exp' in payload else TOKEN_CACHE.ttl
+                    if sisa > 0:
+                        TOKEN_CACHE.set(token_receive, payload, sisa)
+            g.token_payload = payload
+    return g.token_payload
+
+
+def resolve_identity(role, segar=False):
+    # segar=True melewati IDENTITAS_CACHE. Dipakai sebelum menulis data, karena
+    # invalidasi_identitas() hanya membersihkan cache di worker yang menghapus user.
+    identitas = g.setdefault('identitas', {})
+    disegarkan = g.setdefault('identitas_segar', set())
+    if role not in identitas or (segar and role not in disegarkan):
+        identitas[role] = None
+        payload = get_token_payload()
+        # Token lama belum punya 'role', jadi dicoba di kedua koleksi
+        if payload and payload.get('role', role) == role:
+            kunci = (role, payload["id"])
+            if not segar:
+                identitas[role] = IDENTITAS_CACHE.get(kunci)
+            if identitas[role] is None:
+                g.identity_queries = g.get('identity_queries', 0) + 1
+                if role == 'admin':
+                    identitas[role] = db.admin.find_one({"admin": payload["id"]})
+                else:
+                    identitas[role] = db.users.find_one({"nama": payload["id"]})
+                # Hasil kosong tidak disimpan, supaya user yang baru daftar langsung dikenali
+                if identitas[role] is not None:
+                    IDENTITAS_CACHE.set(kunci, identitas[role])
+                else:
+                    IDENTITAS_CACHE.hapus(lambda k: k == kunci)
+        if segar:
+            disegarkan.add(role)
+    return identitas[role]
+
+
+def invalidasi_identitas(role, id):
+    # Dipanggil setiap kali dokumen user/admin diubah atau dihapus
+    IDENTITAS_CACHE.hapus(lambda kunci: kunci == (role, id))
+    RENDER_CACHE.hapus(lambda kunci: kunci[1] in ((role, id), (None, id)))
+
+
+@app.after_request
+def report_identity_queries(response):
+    response.headers['X-Identity-Queries'] = str(g.get('identity_queries', 0))
+    return response
+
+# _________________ Token User ________________________________________________
+
+
+def get_user_info(segar=False):
+    return resolve_identity('user', segar)
 
 
 @app.context_processor
@@ -48,23 +644,31 @@ def inject_user_info():
     user_info = get_user_info()
     return dict(user_info=user_info)
 
+
+def user_api(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not get_user_info():
+            return jsonify({'result': 'error', 'message': 'Token tidak valid!'}), 401
+        return f(*args, **kwargs)
+    return wrapper
+
 # _________________ End Token User ________________________________________________
 
 # _________________ Token Admin ________________________________________________
 
 
-def get_admin_info():
-    token_receive = request.cookies.get("mytoken")
-    admininfo = None
-    if token_receive:
-        try:
-            payload = jwt.decode(token_receive, SECRET_KEY,algorithms=["HS256"])
-            admininfo = db.admin.find_one({"admin": payload["id"]})
-        except jwt.ExpiredSignatureError:
-            pass
-        except jwt.exceptions.DecodeError:
-            pass
-    return admininfo
+def get_admin_info(segar=False):
+    return resolve_identity('admin', segar)
+
+
+def admin_api(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not get_admin_info():
+            return jsonify({'result': 'error', 'message': 'Token tidak valid!'}), 401
+        return f(*args, **kwargs)
+    return wrapper
 
 
 @app.context_processor
@@ -75,43 +679,170 @@ def inject_admin_info():
 # _________________ End Token Admin ________________________________________________
 
 
-def get_user_data():
-    users_info = get_user_info()
-    jumlah_user = db.users.count_documents({})
-    jumlah_antri = db.antrian.count_documents({})
-    jumlah_mcu = db.medical_checkup.count_documents({})
-    users = db.users.find({})
-    antrian = db.antrian.find({})
-    mcu = db.medical_checkup.find({})
-    hasil_mcu = db.hasil_mcu.find({})
-    data_user = db.users.find_one({'_id': users_info})
+class LazyInformasi(Mapping):
 
-    mcu_data = db.medical_checkup.find({}, {'nama_mcu': 1})
-    mcu_list = [mcu_item['nama_mcu'] for mcu_item in mcu_data]
+    def __init__(self, loaders):
+        self._loaders = loaders
+        self._data = {}
 
-    informasi = {
-        'jumlah_user': jumlah_user,
-        'jumlah_antrian': jumlah_antri,
-        'user': users,
-        'mcu': mcu,
-        'antrian': antrian,
-        'mcu_jumlah': jumlah_mcu,
-        'data_user': data_user,
-        'mcu_list': mcu_list,
-        'hasil_mcu': hasil_mcu,
-    }
-    return informasi
+    def __getitem__(self, key):
+        if key not in self._data:
+            self._data[key] = self._loaders[key]()
+        return self._data[key]
 
+    def __iter__(self):
+        return iter(self._loaders)
 
-def get_all_users():
-    users_collection = db.users
-    users = users_collection.find({})
-    result = []
+    def __len__(self):
+        return len(self._loaders)
+
+
+# _________________ Cache Halaman ________________________________________________
+
+
+RENDER_CACHE = CacheLRU(maxsize=512, ttl=300)
+
+
+def kunci_pengunjung():
+    # Tanpa query ke MongoDB: cukup isi token untuk membedakan anonim,
+    # user dan admin, supaya halaman yang dipersonalisasi tidak tertukar.
+    payload = get_token_payload()
+    if not payload:
+        return None
+    return (payload.get('role'), payload.get('id'))
+
+
+def cache_halaman(ttl):
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            pengunjung = kunci_pengunjung()
+            kunci = (request.endpoint, pengunjung)
+            halaman = RENDER_CACHE.get(kunci)
+            if halaman is None:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                halaman = {'body': body, 'mimetype': response.mimetype, 'etag': hashlib.sha256(body).hexdigest(), 'varian': {}}
+                RENDER_CACHE.set(kunci, halaman, ttl)
+
+            # Versi terkompresi disimpan di samping body asli, jadi cache hit tidak
+            # mengompres ulang; tiap representasi punya ETag kuat sendiri.
+            encoding = None
+            if len(halaman['body']) >= KOMPRES_MIN and halaman['mimetype'] in KOMPRES_MIMETYPE:
+                encoding = pilih_encoding()
+            if encoding is None:
+                response = Response(halaman['body'], mimetype=halaman['mimetype'])
+                response.set_etag(halaman['etag'])
+            else:
+                if encoding not in halaman['varian']:
+                    halaman['varian'][encoding] = kompres(halaman['body'], encoding)
+                response = Response(halaman['varian'][encoding], mimetype=halaman['mimetype'])
+                response.headers['Content-Encoding'] = encoding
+                response.set_etag(f"{halaman['etag']}-{encoding}")
+            response.vary.add('Accept-Encoding')
+            response.headers['Cache-Control'] = 'private, no-cache' if pengunjung else 'public, no-cache'
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
 
-    for user in users:
-        result.append({'id': str(user['_id']), 'nama': user.get('nama', '')})
 
-    return result
+def invalidasi_halaman(endpoint):
+    RENDER_CACHE.hapus(lambda kunci: kunci[0] == endpoint)
+
+
+# _________________ Format Tanggal ________________________________________________
+
+HARI = ['Senin', 'Selasa', 'Rabu', 'Kamis', 'Jumat', 'Sabtu', 'Minggu']
+BULAN_SINGKAT = ['Jan', 'Feb', 'Mar', 'Apr', 'Mei', 'Jun', 'Jul', 'Agu', 'Sep', 'Okt', 'Nov', 'Des']
+BULAN_PARSE = {nama.lower(): nomor for nomor, nama in enumerate(BULAN_SINGKAT, 1)}
+BULAN_PARSE.update({nama.lower(): nomor for nomor, nama in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)})
+
+
+def format_tanggal(tanggal):
+    return f'{tanggal.day:02d} {BULAN_SINGKAT[tanggal.month - 1]} {tanggal.year}'
+
+
+def parse_tanggal_antrian(teks):
+    # Data lama disimpan sebagai '%d %b %Y' dengan locale id_ID ('07 Mei 2024')
+    hari, bulan, tahun = teks.split()
+    return datetime(int(tahun), BULAN_PARSE[bulan.lower()], int(hari))
+
+
+@app.template_filter('tanggal_id')
+def tanggal_id(tanggal):
+    if isinstance(tanggal, datetime):
+        return format_tanggal(tanggal)
+    return tanggal
+
+# _________________ Statistik Dashboard ________________________________________________
+
+STATISTIK_KOLEKSI = ('users', 'antrian', 'medical_checkup', 'hasil_mcu')
+# Jumlah antrian di dashboard mencakup pendaftaran yang sudah diarsipkan. Arsip
+# tidak ikut disimpan di counter karena index TTL menghapusnya tanpa memberi tahu
+# aplikasi; jumlahnya dibaca dari metadata koleksi setiap kali dibutuhkan.
+STATISTIK_ARSIP = {'antrian': 'antrian_arsip'}
+# Dinaikkan bila arti counter berubah, supaya dokumen lama dihitung ulang otomatis
+STATISTIK_VERSI = 2
+DASHBOARD_TERBARU = 3
+
+
+def hitung_ulang_statistik():
+    statistik = {koleksi: db[koleksi].count_documents({}) for koleksi in STATISTIK_KOLEKSI}
+    statistik['versi'] = STATISTIK_VERSI
+    db.statistik.update_one({'_id': 'dashboard'}, {'$set': statistik}, upsert=True)
+    return statistik
+
+
+def get_statistik():
+    statistik = db.statistik.find_one({'_id': 'dashboard'})
+    if statistik is None or statistik.get('versi') != STATISTIK_VERSI:
+        statistik = hitung_ulang_statistik()
+    for koleksi, arsip in STATISTIK_ARSIP.items():
+        statistik[koleksi] += db[arsip].estimated_document_count()
+    return statistik
+
+
+def ubah_statistik(koleksi, jumlah):
+    # Tanpa upsert: kalau dokumen belum ada, get_statistik() akan menghitung
+    # ulang dari koleksi aslinya, termasuk perubahan ini.
+    if jumlah:
+        db.statistik.update_one({'_id': 'dashboard'}, {'$inc': {koleksi: jumlah}})
+
+
+@app.cli.command('hitung-ulang-statistik')
+def hitung_ulang_statistik_command():
+    hitung_ulang_statistik()
+    statistik = get_statistik()
+    for koleksi in STATISTIK_KOLEKSI:
+        print(f'{koleksi}: {statistik[koleksi]}')
+
+
+def get_user_data():
+    # Setiap key baru menyentuh MongoDB saat benar-benar dibaca template,
+    # lalu hasilnya dipakai ulang sampai request selesai.
+    if 'informasi' not in g:
+        g.informasi = LazyInformasi({
+            'statistik': get_statistik,
+            'jumlah_user': lambda: g.informasi['statistik']['users'],
+            'jumlah_antrian': lambda: g.informasi['statistik']['antrian'],
+            'mcu_jumlah': lambda: g.informasi['statistik']['medical_checkup'],
+            'hasil_jumlah': lambda: g.informasi['statistik']['hasil_mcu'],
+            'mcu': lambda: list(db.medical_checkup.find({})),
+            'user_terbaru': lambda: list(db.users.find(
+                {}, {'nama': 1, 'jenis_kelamin': 1, 'alamat': 1}
+            ).sort('_id', -1).limit(DASHBOARD_TERBARU)),
+            'antrian_terbaru': lambda: list(db.antrian.find(
+                {}, {'nama': 1, 'nomor_antrian': 1, 'hari': 1, 'tanggal': 1, 'sesi': 1, 'jam': 1}
+            ).sort('_id', -1).limit(DASHBOARD_TERBARU)),
+            'hasil_mcu_terbaru': lambda: list(db.hasil_mcu.find({}).sort('_id', -1).limit(DASHBOARD_TERBARU)),
+            'data_user': get_user_info,
+            'mcu_list': lambda: [mcu_item['nama_mcu'] for mcu_item in db.medical_checkup.find({}, {'nama_mcu': 1})],
+        })
+    return g.informasi
 
 
 def get_updated_user_data():
@@ -132,7 +863,7 @@ def get_updated_user_data():
 
 
 @app.context_processor
-def inject_user_info():
+def inject_informasi():
     informasi = get_user_data()
     return dict(informasi=informasi)
 
@@ -140,12 +871,320 @@ def inject_user_info():
 def get_user_mcu_data():
     user_info = get_user_info()
     if user_info:
-        user_id = user_info['_id']
-        user_id = str(user_id)
-        hasil_mcu_data = list(db.hasil_mcu.find({"user_id": user_id}))
-        return {"hasil_mcu": hasil_mcu_data}
+        # Hanya hasil terbaru; riwayat lengkap diambil per halaman lewat /api/hasil_mcu
+        terbaru = db.hasil_mcu.find_one({"user_id": str(user_info['_id'])}, sort=HASIL_MCU_URUTAN)
+        return {"terbaru": terbaru}
     else:
-        return {"hasil_mcu": []}
+        return {"terbaru": None}
+
+# _________________ Index MongoDB ________________________________________________
+
+INDEXES = {
+    'users': [
+        ([('nama', 1), ('nik', 1)], {'name': 'nama_nik'}),
+        ([('nik', 1)], {'name': 'nik_unik', 'unique': True}),
+        ([('nama_normal', 1)], {'name': 'nama_normal'}),
+    ],
+    'antrian': [
+        ([('user_id', 1), ('tanggal', 1)], {'name': 'user_tanggal'}),
+        # Satu pendaftaran per user per hari; pendaftar tanpa login (user_id null) dikecualikan
+        ([('tanggal', 1), ('user_id', 1)], {
+            'name': 'tanggal_user_unik', 'unique': True, 'partialFilterExpression': {'user_id': {'$type': 'objectId'}},
+        }),
+        ([('tanggal', 1), ('sesi', 1), ('mcu', 1), ('nomor_antrian', 1)], {'name': 'tanggal_sesi_mcu_nomor'}),
+    ],
+    'hasil_mcu': [
+        ([('user_id', 1), ('tanggal_pemeriksaan', -1), ('_id', -1)], {'name': 'user_tanggal_pemeriksaan'}),
+        ([('mcu', 1), ('tanggal_pemeriksaan', 1)], {'name': 'mcu_tanggal_pemeriksaan'}),
+    ],
+    'antrian_arsip': [
+        ([('user_id', 1), ('tanggal', 1)], {'name': 'user_tanggal'}),
+        ([('tanggal', 1), ('sesi', 1), ('mcu', 1), ('nomor_antrian', 1)], {'name': 'tanggal_sesi_mcu_nomor'}),
+        ([('bulan', 1), ('mcu', 1)], {'name': 'bulan_mcu'}),
+    ],
+    'antrian_counter': [
+        ([('tanggal', 1)], {'name': 'tanggal'}),
+    ],
+    'admin': [
+        ([('admin', 1)], {'name': 'admin'}),
+    ],
+    'rollup_hasil_mcu': [
+        ([('bulan', 1), ('mcu', 1)], {'name': 'bulan_mcu'}),
+    ],
+    'tugas': [
+        ([('dibuat_pada', 1)], {'name': 'kedaluwarsa', 'expireAfterSeconds': 7 * 24 * 3600}),
+    ],
+}
+
+# Query yang jalan di hampir setiap request; semuanya wajib memakai index
+HOT_QUERIES = [
+    ('login', 'users', {'nama': '', 'nik': ''}),
+    ('identitas user', 'users', {'nama': ''}),
+    ('register', 'users', {'nik': ''}),
+    ('cari user', 'users', {'nama_normal': {'$regex': '^a'}}),
+    ('cek pendaftaran ganda', 'antrian', {'user_id': ObjectId(), 'tanggal': datetime.min}),
+    ('antrian per sesi', 'antrian', {'tanggal': datetime.min, 'sesi': '', 'mcu': ''}),
+    ('daftar antrian admin', 'antrian', {'tanggal': {'$gte': datetime.min}, 'sesi': ''}),
+    ('daftar arsip antrian admin', 'antrian_arsip', {'tanggal': {'$gte': datetime.min}, 'sesi': ''}),
+    ('antrian siap diarsipkan', 'antrian', {'tanggal': {'$lt': datetime.min}}),
+    ('hasil mcu user', 'hasil_mcu', {'user_id': ''}),
+    ('batas rollup', 'hasil_mcu', {'mcu': '', 'tanggal_pemeriksaan': {'$gte': datetime.min, '$lt': datetime.max}}),
+    ('ketersediaan slot', 'antrian_counter', {'tanggal': {'$in': [datetime.min]}}),
+    ('identitas admin', 'admin', {'admin': ''}),
+    ('login admin', 'admin', {'admin': '', 'password': ''}),
+]
+
+
+def ensure_indexes():
+    # create_index tidak melakukan apa-apa jika index yang sama sudah ada. Index
+    # yang gagal dibuat (mis. index unik di atas data ganda) hanya dicatat supaya
+    # server tetap bisa jalan; `flask buat-index` menampilkan daftarnya.
+    gagal = []
+    for koleksi, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[koleksi].create_index(keys, **options)
+            except OperationFailure as e:
+                app.logger.error('Index %s.%s gagal dibuat: %s', koleksi, options['name'], e)
+                gagal.append((koleksi, options['name'], str(e)))
+    pasang_retensi_arsip()
+    return gagal
+
+
+def pasang_retensi_arsip():
+    # Index TTL di antrian_arsip.tanggal; 0 hari berarti arsip disimpan selamanya
+    detik = muat_konfigurasi()['ANTRIAN_ARSIP_RETENSI_HARI'] * 24 * 60 * 60
+    index = {item['name']: item for item in db.antrian_arsip.list_indexes()}
+    if detik <= 0:
+        if 'retensi' in index:
+            db.antrian_arsip.drop_index('retensi')
+    elif 'retensi' not in index:
+        db.antrian_arsip.create_index('tanggal', name='retensi', expireAfterSeconds=detik)
+    elif index['retensi'].get('expireAfterSeconds') != detik:
+        db.command('collMod', 'antrian_arsip', index={'name': 'retensi', 'expireAfterSeconds': detik})
+
+
+def tahap_query(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from tahap_query(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from tahap_query(value)
+
+
+def cek_query_plan():
+    hasil = []
+    for nama, koleksi, filter_query in HOT_QUERIES:
+        plan = db[koleksi].find(filter_query).explain()['queryPlanner']['winningPlan']
+        tahap = list(tahap_query(plan))
+        hasil.append((nama, koleksi, tahap, 'COLLSCAN' not in tahap))
+    return hasil
+
+
+@app.cli.command('buat-index')
+def buat_index():
+    gagal = ensure_indexes()
+    for koleksi in INDEXES:
+        print(f'{koleksi}: {", ".join(db[koleksi].index_information())}')
+    if gagal:
+        for koleksi, nama, message in gagal:
+            print(f'Gagal: {koleksi}.{nama} {message}')
+        raise click.ClickException('Sebagian index gagal dibuat; untuk nik_unik cek data ganda dengan `flask nik-ganda`')
+
+
+@app.cli.command('nik-ganda')
+def nik_ganda():
+    ganda = list(db.users.aggregate([
+        {'$group': {'_id': '$nik', 'users': {'$push': {'_id': '$_id', 'nama': '$nama'}}, 'jumlah': {'$sum': 1}}},
+        {'$match': {'jumlah': {'$gt': 1}}},
+    ]))
+    for item in ganda:
+        print(', '.join(f"{user['_id']} ({user['nama']})" for user in item['users']))
+    print(f'{len(ganda)} NIK terdaftar lebih dari sekali')
+
+
+@app.cli.command('cek-index')
+def cek_index():
+    gagal = []
+    for nama, koleksi, tahap, ok in cek_query_plan():
+        print(f'{"OK  " if ok else "SCAN"} {koleksi:<12} {nama:<24} {" > ".join(tahap)}')
+        if not ok:
+            gagal.append(nama)
+    if gagal:
+        raise click.ClickException(f'COLLSCAN pada: {", ".join(gagal)}')
+
+# _________________ Aset Statis ________________________________________________
+
+STATIC_DIR = join(dirname(__file__), 'static')
+DIST_DIR = join(STATIC_DIR, 'dist')
+ASET_KOMPRES = ('.css', '.js', '.svg', '.json', '.txt')
+ASET_GAMBAR = ('.jpg', '.jpeg', '.png')
+ASET_LEBAR = (480, 960)
+ASET_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def baca_manifest():
+    try:
+        with open(join(DIST_DIR, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@lru_cache(maxsize=1)
+def muat_manifest():
+    return baca_manifest()
+
+
+@app.template_global()
+def aset(filename):
+    # Tanpa 'flask build-aset' file tetap dilayani dari static/ seperti biasa
+    item = muat_manifest().get(filename)
+    if item:
+        return url_for('aset_statis', filename=item['file'])
+    return url_for('static', filename=filename)
+
+
+@app.template_global()
+def aset_srcset(filename):
+    item = muat_manifest().get(filename) or {}
+    return ', '.join(f"{url_for('aset_statis', filename=path)} {lebar}w" for lebar, path in item.get('lebar', {}).items())
+
+
+def tulis_atomik(path, isi):
+    sementara = f'{path}.tmp'
+    with open(sementara, 'wb') as f:
+        f.write(isi)
+    os.replace(sementara, path)
+
+
+def tulis_aset(relatif, isi, image_module=None, brotli_module=None):
+    # Nama file mengandung hash isinya, jadi yang sudah ada tidak perlu ditulis
+    # ulang. File utama ditulis paling akhir: kalau ia ada, variannya juga lengkap.
+    path = join(DIST_DIR, relatif)
+    if os.path.isfile(path):
+        return
+    os.makedirs(dirname(path), exist_ok=True)
+
+    ext = os.path.splitext(relatif)[1].lower()
+    if ext in ASET_KOMPRES:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(isi, compresslevel=9, mtime=0))
+        if brotli_module:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli_module.compress(isi, quality=11))
+    if ext in ASET_GAMBAR and image_module:
+        webp = io.BytesIO()
+        image_module.open(io.BytesIO(isi)).save(webp, 'WEBP', quality=80, method=6)
+        if webp.tell() < len(isi):
+            with open(path + '.webp', 'wb') as f:
+                f.write(webp.getvalue())
+    tulis_atomik(path, isi)
+
+
+def build_aset():
+    try:
+        from PIL import Image as image_module
+    except ImportError:
+        image_module = None
+    try:
+        import brotli as brotli_module
+    except ImportError:
+        brotli_module = None
+
+    # dist/ tidak dikosongkan: worker yang masih berjalan dan HTML yang sudah
+    # ter-cache tetap merujuk file hash lama. Hapus dengan 'flask bersihkan-aset'.
+    manifest = {}
+    for root, dirs, files in os.walk(STATIC_DIR):
+        if root == STATIC_DIR:
+            dirs[:] = [d for d in dirs if d != 'dist']
+        for nama in sorted(files):
+            relatif = os.path.relpath(join(root, nama), STATIC_DIR).replace(os.sep, '/')
+            with open(join(root, nama), 'rb') as f:
+                isi = f.read()
+            dasar, ext = os.path.splitext(relatif)
+            hash_isi = hashlib.sha256(isi).hexdigest()[:10]
+            item = {'file': f'{dasar}.{hash_isi}{ext}'}
+            tulis_aset(item['file'], isi, image_module, brotli_module)
+
+            if ext.lower() in ASET_GAMBAR and image_module:
+                gambar = image_module.open(io.BytesIO(isi))
+                format_gambar = gambar.format
+                for lebar in ASET_LEBAR:
+                    if gambar.width <= lebar:
+                        continue
+                    kecil = gambar.resize((lebar, round(gambar.height * lebar / gambar.width)), image_module.LANCZOS)
+                    buffer = io.BytesIO()
+                    kecil.save(buffer, format_gambar, optimize=True)
+                    item.setdefault('lebar', {})[lebar] = f'{dasar}.{hash_isi}.{lebar}w{ext}'
+                    tulis_aset(item['lebar'][lebar], buffer.getvalue(), image_module, brotli_module)
+                if 'lebar' in item:
+                    item['lebar'][gambar.width] = item['file']
+            manifest[relatif] = item
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    tulis_atomik(join(DIST_DIR, 'manifest.json'), json.dumps(manifest, indent=2).encode('utf-8'))
+    muat_manifest.cache_clear()
+    return manifest, image_module is not None, brotli_module is not None
+
+
+def bersihkan_aset(umur_detik):
+    # Hanya file yang tidak dirujuk manifest saat ini dan sudah cukup lama,
+    # supaya halaman yang ter-cache sebelum build terakhir tidak ikut rusak.
+    dipakai = {'manifest.json'}
+    for item in baca_manifest().values():
+        for relatif in [item['file'], *item.get('lebar', {}).values()]:
+            dipakai.update(relatif + akhiran for akhiran in ('', '.gz', '.br', '.webp'))
+    batas = time.time() - umur_detik
+    dihapus = 0
+    for root, dirs, files in os.walk(DIST_DIR):
+        for nama in files:
+            path = join(root, nama)
+            relatif = os.path.relpath(path, DIST_DIR).replace(os.sep, '/')
+            if relatif not in dipakai and os.path.getmtime(path) < batas:
+                os.remove(path)
+                dihapus += 1
+    return dihapus
+
+
+@app.cli.command('build-aset')
+def build_aset_command():
+    manifest, webp, br = build_aset()
+    print(f'{len(manifest)} aset ditulis ke {DIST_DIR} (webp: {"ya" if webp else "tidak"}, brotli: {"ya" if br else "tidak"})')
+
+
+@app.cli.command('bersihkan-aset')
+@click.option('--jam', default=24, show_default=True, help='Umur minimal file hash lama yang dihapus.')
+def bersihkan_aset_command(jam):
+    print(f'{bersihkan_aset(jam * 60 * 60)} file lama dihapus dari {DIST_DIR}')
+
+
+@app.route('/aset/<path:filename>')
+def aset_statis(filename):
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    kirim, encoding = path, None
+    if mimetype.startswith('image/') and 'image/webp' in request.headers.get('Accept', ''):
+        if os.path.isfile(path + '.webp'):
+            kirim, mimetype = path + '.webp', 'image/webp'
+    elif request.accept_encodings.quality('br') and os.path.isfile(path + '.br'):
+        kirim, encoding = path + '.br', 'br'
+    elif request.accept_encodings.quality('gzip') and os.path.isfile(path + '.gz'):
+        kirim, encoding = path + '.gz', 'gzip'
+
+    response = send_file(kirim, mimetype=mimetype, max_age=ASET_MAX_AGE, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(['Accept', 'Accept-Encoding'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 # _________________ Login Page Display ________________________________________________
 
@@ -168,7 +1207,7 @@ def login():
         user = db.users.find_one({'nama': nama_received, 'nik': hashed_nik})
 
         if user:
-            token = jwt.encode({'id': nama_received, "exp": datetime.utcnow() + timedelta(seconds=60 * 60 * 24)}, SECRET_KEY, algorithm='HS256')
+            token = jwt.encode({'id': nama_received, 'role': 'user', "exp": datetime.utcnow() + timedelta(seconds=60 * 60 * 24)}, muat_konfigurasi()['SECRET_KEY'], algorithm='HS256')
             response = jsonify({
                 "result": "success",
                 "token": token,
@@ -188,7 +1227,7 @@ def show_pendaftaranonline():
     if not user_info:
         return redirect(url_for("login"))
 
-    user_data = db.users.find_one({'_id': user_info['_id']})
+    user_data = user_info
 
     if user_data:
         nama_pengguna = user_data.get('nama')
@@ -198,6 +1237,245 @@ def show_pendaftaranonline():
     else:
         return jsonify({'error': 'Data pengguna tidak ditemukan'})
 
+# _________________ Jadwal Sesi ________________________________________________
+
+SESI = {
+    'pagi': {'label': 'Pagi', 'mulai': '08:00', 'selesai': '12:00', 'durasi': 60},
+    'siang': {'label': 'Siang', 'mulai': '12:30', 'selesai': '14:30', 'durasi': 15},
+    'sore': {'label': 'Sore', 'mulai': '15:00', 'selesai': '18:00', 'durasi': 15},
+}
+
+
+def buat_jadwal_sesi(config):
+    jam_awal = datetime.strptime(config['mulai'], '%H:%M')
+    jam_akhir = datetime.strptime(config['selesai'], '%H:%M')
+    durasi = timedelta(minutes=config['durasi'])
+    return {'label': config['label'], 'jam_awal': jam_awal, 'durasi': durasi, 'kapasitas': (jam_akhir - jam_awal) // durasi}
+
+
+JADWAL_SESI = {nama: buat_jadwal_sesi(config) for nama, config in SESI.items()}
+
+SLOT_CACHE_TTL = 10
+SLOT_HARI_MAKS = 20
+SLOT_CACHE = {}
+SLOT_CACHE_LOCK = threading.Lock()
+
+
+def hari_kerja_berikutnya(jumlah, mulai=None):
+    tanggal = (mulai or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    hasil = []
+    while len(hasil) < jumlah:
+        tanggal += timedelta(days=1)
+        if tanggal.weekday() < 5:
+            hasil.append(tanggal)
+    return hasil
+
+
+def ketersediaan_slot(jumlah_hari, daftar_mcu):
+    # Satu query ke antrian_counter untuk semua tanggal; slot yang belum
+    # punya counter berarti masih kosong.
+    daftar_tanggal = hari_kerja_berikutnya(jumlah_hari)
+    terisi = {}
+    for counter in db.antrian_counter.find({'tanggal': {'$in': daftar_tanggal}}, {'terisi': 1}):
+        terisi[counter['_id']] = counter['terisi']
+
+    hasil = []
+    for tanggal in daftar_tanggal:
+        slot = {}
+        for nama, jadwal in JADWAL_SESI.items():
+            slot[jadwal['label']] = {
+                mcu: {
+                    'kapasitas': jadwal['kapasitas'],
+                    'sisa': max(jadwal['kapasitas'] - terisi.get(kunci_antrian(tanggal, nama, mcu), 0), 0),
+                }
+                for mcu in daftar_mcu
+            }
+        hasil.append({'tanggal': tanggal.strftime('%Y-%m-%d'), 'slot': slot})
+    return hasil
+
+
+@app.route('/api/slot')
+def api_slot():
+    jumlah_hari = min(max(request.args.get('hari', 5, type=int), 1), SLOT_HARI_MAKS)
+    mcu = request.args.get('mcu')
+    kunci = (datetime.now().date(), jumlah_hari, mcu)
+
+    with SLOT_CACHE_LOCK:
+        cache = SLOT_CACHE.get(kunci)
+    if not cache or cache[0] < time.monotonic():
+        daftar_mcu = [mcu] if mcu else [item['nama_mcu'] for item in db.medical_checkup.find({}, {'nama_mcu': 1})]
+        cache = (time.monotonic() + SLOT_CACHE_TTL, ketersediaan_slot(jumlah_hari, daftar_mcu))
+        with SLOT_CACHE_LOCK:
+            if len(SLOT_CACHE) > 256:
+                SLOT_CACHE.clear()
+            SLOT_CACHE[kunci] = cache
+
+    response = jsonify({'result': 'success', 'data': cache[1]})
+    response.headers['Cache-Control'] = f'public, max-age={SLOT_CACHE_TTL}'
+    return response
+
+
+# _________________ Alokasi Nomor Antrian ________________________________________________
+
+
+def kunci_antrian(tanggal, sesi, mcu):
+    return f'{tanggal:%Y-%m-%d}|{sesi.lower()}|{mcu}'
+
+
+def alokasi_nomor_antrian(tanggal, sesi, mcu, kapasitas):
+    # Satu dokumen counter per (tanggal, sesi, mcu); $inc atomik menjamin
+    # nomor tidak kembar walau banyak pendaftaran masuk bersamaan. Nomor yang
+    # dikembalikan (lihat kembalikan_nomor_antrian) dipakai lebih dulu, dan
+    # selama masih ada, $inc tidak boleh jalan karena terisi < nomor tertinggi.
+    kunci = kunci_antrian(tanggal, sesi, mcu)
+    for _ in range(3):
+        counter = db.antrian_counter.find_one_and_update(
+            {'_id': kunci, 'kosong.0': {'$exists': True}},
+            {'$pop': {'kosong': -1}, '$inc': {'terisi': 1}},
+        )
+        if counter:
+            return counter['kosong'][0]
+        try:
+            counter = db.antrian_counter.find_one_and_update(
+                {'_id': kunci, 'terisi': {'$lt': kapasitas}, 'kosong.0': {'$exists': False}},
+                {'$inc': {'terisi': 1},
+                 '$setOnInsert': {'tanggal': tanggal, 'sesi': sesi.lower(), 'mcu': mcu}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return counter['terisi']
+        except DuplicateKeyError:
+            # Counter sudah penuh sehingga upsert mencoba insert _id yang sama,
+            # dua upsert pertama balapan, atau baru ada nomor yang dikembalikan;
+            # selain penuh cukup diulang.
+            counter = db.antrian_counter.find_one({'_id': kunci})
+            if counter and counter['terisi'] >= kapasitas:
+                return None
+    return None
+
+
+def kembalikan_nomor_antrian(tanggal, sesi, mcu, nomor):
+    # Nomor yang sudah dialokasikan tetapi antriannya gagal disimpan
+    db.antrian_counter.update_one(
+        {'_id': kunci_antrian(tanggal, sesi, mcu)},
+        {'$inc': {'terisi': -1}, '$push': {'kosong': {'$each': [nomor], '$sort': 1}}},
+    )
+
+
+def bangun_ulang_counter_antrian():
+    data = db.antrian.aggregate([
+        {"$group": {
+            "_id": {"tanggal": "$tanggal", "sesi": {"$toLower": "$sesi"}, "mcu": "$mcu"},
+            "terisi": {"$max": "$nomor_antrian"}
+        }}
+    ])
+    jumlah = 0
+    for item in data:
+        tanggal, sesi, mcu = item['_id']['tanggal'], item['_id']['sesi'], item['_id']['mcu']
+        db.antrian_counter.update_one(
+            {'_id': kunci_antrian(tanggal, sesi, mcu)},
+            {'$set': {'tanggal': tanggal, 'sesi': sesi, 'mcu': mcu, 'terisi': item['terisi'], 'kosong': []}},
+            upsert=True
+        )
+        jumlah += 1
+    return jumlah
+
+
+@app.cli.command('bangun-counter-antrian')
+def bangun_counter_antrian():
+    print(f'{bangun_ulang_counter_antrian()} counter antrian diperbarui')
+
+
+@app.cli.command('migrasi-tanggal-antrian')
+@click.option('--batch', default=1000, help='Jumlah dokumen per bulk_write.')
+def migrasi_tanggal_antrian(batch):
+    diubah, gagal, operasi = 0, [], []
+    for doc in db.antrian.find({'tanggal': {'$type': 'string'}}, {'tanggal': 1}):
+        try:
+            operasi.append(UpdateOne({'_id': doc['_id']}, {'$set': {'tanggal': parse_tanggal_antrian(doc['tanggal'])}}))
+        except (ValueError, KeyError):
+            gagal.append(doc)
+        if len(operasi) >= batch:
+            diubah += db.antrian.bulk_write(operasi, ordered=False).modified_count
+            operasi = []
+    if operasi:
+        diubah += db.antrian.bulk_write(operasi, ordered=False).modified_count
+
+    # Counter lama memakai kunci tanggal berbentuk string
+    db.antrian_counter.delete_many({'tanggal': {'$type': 'string'}})
+    bangun_ulang_counter_antrian()
+
+    print(f'{diubah} dokumen antrian dimigrasi')
+    for doc in gagal:
+        print(f'Gagal: {doc["_id"]} tanggal={doc["tanggal"]!r}')
+
+# _________________ Jumlah Antrian per MCU ________________________________________________
+
+
+def ubah_jumlah_antrian(mcu, jumlah):
+    db.antrian_jumlah.update_one({'_id': mcu}, {'$inc': {'total': jumlah}}, upsert=True)
+
+
+def bangun_ulang_jumlah_antrian():
+    data = list(db.antrian.aggregate([
+        {"$group": {"_id": "$mcu", "total": {"$sum": 1}}}
+    ]))
+    for item in data:
+        db.antrian_jumlah.update_one({'_id': item['_id']}, {'$set': {'total': item['total']}}, upsert=True)
+    db.antrian_jumlah.delete_many({'_id': {'$nin': [item['_id'] for item in data]}})
+    return len(data)
+
+
+def hitung_antrian_per_mcu():
+    data = list(db.antrian_jumlah.find({'total': {'$gt': 0}}).sort('_id', 1))
+    if not data and db.antrian.estimated_document_count():
+        # Koleksi ringkasan belum pernah dibangun (mis. database lama)
+        bangun_ulang_jumlah_antrian()
+        data = list(db.antrian_jumlah.find({'total': {'$gt': 0}}).sort('_id', 1))
+    return [{'_id': item['_id'], 'totalPendaftar': item['total']} for item in data]
+
+
+@app.cli.command('bangun-jumlah-antrian')
+def bangun_jumlah_antrian():
+    print(f'{bangun_ulang_jumlah_antrian()} jumlah antrian per MCU diperbarui')
+
+# _________________ Arsip Antrian ________________________________________________
+
+ARSIP_BATCH = 1000
+
+
+def arsipkan_antrian(sebelum, batch=ARSIP_BATCH):
+    # Dipindah per batch: salin dulu (upsert, aman diulang bila proses terhenti)
+    # lalu hapus dari antrian, supaya koleksi aktif hanya berisi hari mendatang.
+    dipindah = 0
+    while True:
+        docs = list(db.antrian.find({'tanggal': {'$lt': sebelum}}).sort('tanggal', 1).limit(batch))
+        if not docs:
+            break
+        sekarang = datetime.utcnow()
+        db.antrian_arsip.bulk_write([
+            ReplaceOne({'_id': doc['_id']}, dict(doc, bulan=f"{doc['tanggal']:%Y-%m}", diarsipkan_pada=sekarang), upsert=True)
+            for doc in docs
+        ], ordered=False)
+        terhapus = db.antrian.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}}).deleted_count
+        ubah_statistik('antrian', -terhapus)
+        dipindah += terhapus
+        for mcu, jumlah in Counter(doc.get('mcu') for doc in docs).items():
+            ubah_jumlah_antrian(mcu, -jumlah)
+    return dipindah
+
+
+@app.cli.command('arsipkan-antrian')
+@click.option('--sebelum', help='Arsipkan antrian sebelum tanggal ini (YYYY-MM-DD), default hari ini.')
+@click.option('--batch', default=ARSIP_BATCH, show_default=True, help='Jumlah dokumen per batch.')
+def arsipkan_antrian_command(sebelum, batch):
+    try:
+        batas = datetime.strptime(sebelum, '%Y-%m-%d') if sebelum else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        raise click.ClickException('Format --sebelum harus YYYY-MM-DD')
+    pasang_retensi_arsip()
+    print(f'{arsipkan_antrian(batas, batch)} antrian sebelum {format_tanggal(batas)} dipindah ke antrian_arsip')
+
 # _________________ Queue Registration ________________________________________________
 
 
@@ -210,62 +1488,40 @@ def pendaftaranonline():
         sesi = request.form['sesi']
         mcu = request.form['mcu']
 
-        user_info = get_user_info() if get_user_info() else {'_id': None}
+        payload = get_token_payload()
+        user_info = get_user_info(segar=True)
+        if payload and payload.get('role') == 'user' and user_info is None:
+            # Akun sudah dihapus (mungkin dari worker lain), jangan buat antrian yatim
+            return jsonify({'result': 'error', 'message': 'Token tidak valid!'}), 401
+        user_info = user_info or {'_id': None}
 
         if not (tanggal and sesi and mcu and nama):
             return jsonify({'result': 'error', 'message': 'Data tidak lengkap'})
 
         tanggal_obj = datetime.strptime(tanggal, '%Y-%m-%d')
-        tanggal_formatted = tanggal_obj.strftime('%d %b %Y')
-        hari = tanggal_obj.strftime("%A")
+        tanggal_formatted = format_tanggal(tanggal_obj)
+        hari = HARI[tanggal_obj.weekday()]
 
         tanggal_sekarang = datetime.now()
 
         if tanggal_obj < tanggal_sekarang:
             return jsonify({'result': 'error', 'message': 'Pendaftaran tidak bisa dilakukan untuk tanggal yang sudah lewat'})
 
-        if hari == "Sabtu" or hari == "Minggu":
+        if tanggal_obj.weekday() >= 5:
             return jsonify({'result': 'error', 'message': 'Pelayanan Tidak Tersedia Pada Akhir Pekan (Sabtu atau Minggu)'})
 
-        if sesi.lower() == "pagi":
-            jam_awal = datetime.strptime('08:00', '%H:%M')
-            jam_akhir = datetime.strptime('12:00', '%H:%M')
-            durasi_per_antrian = timedelta(minutes=60)
-        elif sesi.lower() == "siang":
-            jam_awal = datetime.strptime('12:30', '%H:%M')
-            jam_akhir = datetime.strptime('14:30', '%H:%M')
-            durasi_per_antrian = timedelta(minutes=15)
-        elif sesi.lower() == "sore":
-            jam_awal = datetime.strptime('15:00', '%H:%M')
-            jam_akhir = datetime.strptime('18:00', '%H:%M')
-            durasi_per_antrian = timedelta(minutes=15)
-        else:
+        jadwal = JADWAL_SESI.get(sesi.lower())
+        if not jadwal:
             return jsonify({'result': 'error', 'message': 'Sesi tidak valid'})
 
-        if db.antrian.find_one({"user_id": user_info["_id"], "tanggal": tanggal_formatted}):
+        if db.antrian.find_one({"user_id": user_info["_id"], "tanggal": tanggal_obj}):
             return jsonify({'result': 'error', 'message': f'Anda sudah mendaftar pada Hari {hari}, {tanggal_formatted} '})
 
         # _________________ Antrian _________________________
-        if db.antrian.count_documents({"tanggal": tanggal_formatted,
-        "sesi": sesi,
-        "mcu": mcu}) == 0:
-            nomor_antrian_baru = 1
-            jam = jam_awal
-        else:
-            last_item = db.antrian.find_one(sort=[('_id', -1)])
-
-            if (last_item['tanggal'] != tanggal_formatted and
-                last_item['sesi'] != sesi and
-                last_item['mcu'] != mcu):
-
-                nomor_antrian_baru = 1
-                jam = jam_awal
-            else:
-                nomor_antrian_baru = last_item['nomor_antrian'] + 1
-                last_jam = datetime.strptime(last_item['jam'], '%H:%M')
-                jam = last_jam + durasi_per_antrian
-                if jam >= jam_akhir:
-                    return jsonify({'result': 'error', 'message': f'Maaf Untuk Sesi {sesi} hari {hari}, {tanggal_formatted} sudah habis'})
+        nomor_antrian_baru = alokasi_nomor_antrian(tanggal_obj, sesi, mcu, jadwal['kapasitas'])
+        if nomor_antrian_baru is None:
+            return jsonify({'result': 'error', 'message': f'Maaf Untuk Sesi {sesi} hari {hari}, {tanggal_formatted} sudah habis'})
+        jam = jadwal['jam_awal'] + jadwal['durasi'] * (nomor_antrian_baru - 1)
 
         data_pendaftaran = {
             'user_id': user_info["_id"],
@@ -273,12 +1529,23 @@ def pendaftaranonline():
             'nomor_antrian': nomor_antrian_baru,
             'hari': hari,
             'jam': jam.strftime('%H:%M'),
-            'tanggal': tanggal_formatted,
+            'tanggal': tanggal_obj,
             'sesi': sesi,
             'mcu': mcu,
             'nomor_antrian': nomor_antrian_baru
         }
-        db.antrian.insert_one(data_pendaftaran)
+        try:
+            db.antrian.insert_one(data_pendaftaran)
+        except DuplicateKeyError:
+            # Dua kiriman bersamaan lolos cek di atas; index tanggal_user_unik
+            # menolak yang kedua, dan nomornya dikembalikan untuk pendaftar lain.
+            kembalikan_nomor_antrian(tanggal_obj, sesi, mcu, nomor_antrian_baru)
+            return jsonify({'result': 'error', 'message': f'Anda sudah mendaftar pada Hari {hari}, {tanggal_formatted} '})
+        ubah_statistik('antrian', 1)
+        ubah_jumlah_antrian(mcu, 1)
+        SLOT_CACHE.clear()
+        invalidasi_halaman('antrian')
+        HUB_ANTRIAN.publish()
 
         return jsonify({'result': 'success', 'nama': nama,
             'nomor_antrian': nomor_antrian_baru,
@@ -324,14 +1591,20 @@ def register():
             'nama': nama,
             'nik': hashed_nik,
             'jenis_kelamin': jenis_kelamin,
-            'alamat': alamat
+            'alamat': alamat,
+            'nama_normal': normal_nama(nama)
         }
 
         existing_user = db.users.find_one({'nik': hashed_nik})
         if existing_user:
             return jsonify({'result': 'error', 'message': 'NIK sudah terdaftar'})
 
-        db.users.insert_one(user)
+        try:
+            db.users.insert_one(user)
+        except DuplicateKeyError:
+            # Pendaftaran ganda yang bersamaan; index nik_unik yang menolak
+            return jsonify({'result': 'error', 'message': 'NIK sudah terdaftar'})
+        ubah_statistik('users', 1)
 
         return jsonify({'result': 'success', 'message': 'Registrasi berhasil', 'redirect_url': '/login'})
 
@@ -339,6 +1612,7 @@ def register():
 
 
 @app.route('/')
+@cache_halaman(ttl=600)
 def home():
     user_info = get_user_info()
     return render_template('user/index.html', user_info=user_info)
@@ -346,22 +1620,190 @@ def home():
 # _________________ Queue Pages Display ________________________________________________
 
 
+def nomor_dilayani(sekarang=None):
+    # Nomor yang sedang dilayani diturunkan dari jadwal sesi dan counter hari ini,
+    # jadi cukup satu query kecil ke antrian_counter.
+    sekarang = sekarang or datetime.now()
+    hari_ini = sekarang.replace(hour=0, minute=0, second=0, microsecond=0)
+    jam = datetime.combine(datetime(1900, 1, 1), sekarang.time())
+    dilayani = {}
+    for counter in db.antrian_counter.find({'tanggal': hari_ini}, {'sesi': 1, 'mcu': 1, 'terisi': 1}):
+        jadwal = JADWAL_SESI.get(counter['sesi'])
+        if not jadwal or not jadwal['jam_awal'] <= jam < jadwal['jam_awal'] + jadwal['durasi'] * jadwal['kapasitas']:
+            continue
+        slot = (jam - jadwal['jam_awal']) // jadwal['durasi'] + 1
+        dilayani[counter['mcu']] = {
+            'sesi': jadwal['label'],
+            'nomor': min(slot, counter['terisi']),
+            'terisi': counter['terisi'],
+        }
+    return dilayani
+
+
 @app.route('/antrian')
+@cache_halaman(ttl=30)
 def antrian():
     token = request.cookies.get('token')
-    data_antrian = list(db.antrian.aggregate([
-        {"$group": {
-        "_id": "$mcu",
-        "totalPendaftar": {"$sum": 1}
-    }}
-    ]))
+    data_antrian = hitung_antrian_per_mcu()
 
     return render_template('user/antrian.html', token=token, data_antrian=data_antrian)
 
+# _________________ Antrian Langsung (SSE) ________________________________________________
+
+ANTRIAN_JEDA_MIN = 1
+ANTRIAN_HEARTBEAT = 20
+ANTRIAN_ANTREAN_MAKS = 16
+
+
+class HubAntrian:
+    # Satu thread per proses menghitung snapshot antrian lalu membagikannya ke
+    # semua pelanggan, jadi seribu penonton tetap hanya satu agregasi.
+
+    def __init__(self):
+        self.pelanggan = set()
+        self.terakhir = None
+        self.tersimpan = (0, None)
+        self._basi = False
+        self._lock = threading.Lock()
+        self._lock_snapshot = threading.Lock()
+        self._berubah = threading.Event()
+        self._pid = None
+
+    def subscribe(self):
+        antrean = queue.Queue(maxsize=ANTRIAN_ANTREAN_MAKS)
+        with self._lock:
+            if len(self.pelanggan) >= muat_konfigurasi()['ANTRIAN_STREAM_MAKS']:
+                return None
+            self.pelanggan.add(antrean)
+            terakhir = self.terakhir
+            if self._pid != os.getpid():
+                # Thread tidak ikut ter-fork, jadi setiap worker memulai miliknya sendiri
+                self._pid = os.getpid()
+                threading.Thread(target=self._jalan, name='hub-antrian', daemon=True).start()
+                if muat_konfigurasi()['ANTRIAN_CHANGE_STREAM']:
+                    threading.Thread(target=pantau_change_stream, name='change-stream-antrian', daemon=True).start()
+        if terakhir:
+            antrean.put_nowait(terakhir)
+        return antrean
+
+    def unsubscribe(self, antrean):
+        with self._lock:
+            self.pelanggan.discard(antrean)
+
+    def publish(self):
+        self._basi = True
+        self._berubah.set()
+
+    def snapshot(self):
+        return app.json.dumps({
+            'mcu': hitung_antrian_per_mcu(),
+            'dilayani': nomor_dilayani(),
+        })
+
+    def snapshot_tersimpan(self):
+        # Untuk klien di luar batas stream (dan worker sync yang tidak punya
+        # stream sama sekali): semuanya berbagi satu snapshot per worker yang
+        # dihitung ulang paling sering sekali per ANTRIAN_TICK, atau sekali per
+        # ANTRIAN_JEDA_MIN setelah ada perubahan, bukan satu agregasi per sambungan.
+        with self._lock_snapshot:
+            waktu, data = self.tersimpan
+            umur = time.monotonic() - waktu
+            if data is None or umur >= muat_konfigurasi()['ANTRIAN_TICK'] or (self._basi and umur >= ANTRIAN_JEDA_MIN):
+                self._basi = False
+                data = self.snapshot()
+                self.tersimpan = (time.monotonic(), data)
+            return data
+
+    def _jalan(self):
+        while True:
+            self._berubah.wait(muat_konfigurasi()['ANTRIAN_TICK'])
+            self._berubah.clear()
+            with self._lock:
+                pelanggan = list(self.pelanggan)
+            if not pelanggan:
+                continue
+            try:
+                data = self.snapshot()
+            except Exception as e:
+                app.logger.warning('Snapshot antrian gagal: %s', e)
+                time.sleep(ANTRIAN_JEDA_MIN)
+                continue
+            self.tersimpan = (time.monotonic(), data)
+            if data != self.terakhir:
+                self.terakhir = data
+                for antrean in pelanggan:
+                    try:
+                        antrean.put_nowait(data)
+                    except queue.Full:
+                        # Klien yang terlalu lambat cukup menerima data terbaru saja
+                        with antrean.mutex:
+                            antrean.queue.clear()
+                        antrean.put_nowait(data)
+            # Banyak pendaftaran beruntun digabung jadi satu perhitungan ulang
+            time.sleep(ANTRIAN_JEDA_MIN)
+
+
+HUB_ANTRIAN = HubAntrian()
+
+
+def pantau_change_stream():
+    # Opsional (butuh replica set): perubahan dari worker lain ikut memicu update
+    while True:
+        try:
+            with db.antrian.watch([{'$match': {'operationType': {'$in': ['insert', 'delete', 'replace', 'update']}}}]) as stream:
+                for _ in stream:
+                    HUB_ANTRIAN.publish()
+        except Exception as e:
+            app.logger.warning('Change stream antrian terputus: %s', e)
+            time.sleep(5)
+
+
+@app.route('/antrian/stream')
+def antrian_stream():
+    # Setiap stream memegang satu thread worker selama terbuka, jadi stream
+    # langsung butuh worker gthread atau async (gevent/eventlet). Jumlahnya
+    # dibatasi per worker dan umurnya dibatasi supaya thread lain tetap melayani
+    # halaman biasa; klien yang tidak kebagian (termasuk semua klien di worker
+    # sync) menerima snapshot tersimpan lalu menyambung ulang.
+    konfigurasi = muat_konfigurasi()
+    antrean = HUB_ANTRIAN.subscribe()
+    if antrean is None:
+        data = HUB_ANTRIAN.snapshot_tersimpan()
+
+        def kirim():
+            yield f"retry: {konfigurasi['ANTRIAN_TICK'] * 1000}\n\n"
+            yield f'event: antrian\ndata: {data}\n\n'
+    else:
+        if HUB_ANTRIAN.terakhir is None:
+            HUB_ANTRIAN.publish()
+        batas = time.monotonic() + konfigurasi['ANTRIAN_STREAM_DETIK']
+
+        def kirim():
+            try:
+                yield 'retry: 5000\n\n'
+                while True:
+                    sisa = batas - time.monotonic()
+                    if sisa <= 0:
+                        break
+                    try:
+                        data = antrean.get(timeout=min(ANTRIAN_HEARTBEAT, sisa))
+                    except queue.Empty:
+                        yield ': ping\n\n'
+                        continue
+                    yield f'event: antrian\ndata: {data}\n\n'
+            finally:
+                HUB_ANTRIAN.unsubscribe(antrean)
+
+    response = Response(kirim(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # _________________ Instruction Pages Display ________________________________________________
 
 
 @app.route('/petunjuk')
+@cache_halaman(ttl=3600)
 def petunjuk():
     user_info = get_user_info()
     return render_template('user/petunjuk.html', user_info=user_info)
@@ -370,16 +1812,19 @@ def petunjuk():
 
 
 @app.route('/artikelkolesterol')
+@cache_halaman(ttl=3600)
 def artikelkolesterol():
     return render_template('user/artikelkolesterol.html')
 
 
 @app.route('/artikelguladarah')
+@cache_halaman(ttl=3600)
 def artikelguladarah():
     return render_template('user/artikelguladarah.html')
 
 
 @app.route('/artikelurine')
+@cache_halaman(ttl=3600)
 def artikelurine():
     return render_template('user/artikelurine.html')
 
@@ -393,7 +1838,7 @@ def akun():
     if not user_info:
         return redirect(url_for("login"))
 
-    user_data = db.users.find_one({'_id': user_info[str('_id')]})
+    user_data = user_info
 
     if user_data:
         nama_pengguna = user_data.get('nama')
@@ -418,7 +1863,7 @@ def homeAdmin():
     if not admininfo:
         return redirect(url_for("show_loginAdmin"))
 
-    admin_data = db.admin.find_one({'admin': admininfo['admin']})
+    admin_data = admininfo
 
     if admin_data:
         admin_log = admin_data.get('admin')
@@ -440,7 +1885,7 @@ def loginAdmin():
         admin = db.admin.find_one({'admin': nama_received, 'password': pass_received})
 
         if admin:
-            token = jwt.encode({'id': nama_received, "exp": datetime.utcnow() + timedelta(seconds=60 * 60 * 24)}, SECRET_KEY, algorithm='HS256')
+            token = jwt.encode({'id': nama_received, 'role': 'admin', "exp": datetime.utcnow() + timedelta(seconds=60 * 60 * 24)}, muat_konfigurasi()['SECRET_KEY'], algorithm='HS256')
             response = jsonify({
                 "result": "success",
                 "token": token
@@ -465,7 +1910,7 @@ def editrs():
     admininfo = get_admin_info()
     if not admininfo:
         return redirect(url_for("show_loginAdmin"))
-    admin_data = db.admin.find_one({'admin': admininfo['admin']})
+    admin_data = admininfo
     if admin_data:
         admin = admin_data.get('admin')
         password = admin_data.get('password')
@@ -477,23 +1922,22 @@ def editrs():
 
 @app.route('/save_data', methods=['POST'])
 def save_data():
-    try:
-        token_receive = request.cookies.get("mytoken")
-        payload = jwt.decode(token_receive, SECRET_KEY, algorithms=["HS256"])
+    payload = get_token_payload()
+    if not payload or not (get_admin_info(segar=True) or get_user_info(segar=True)):
+        return jsonify({'message': 'Token tidak valid!'})
 
-        nama_mcu = request.form['nama_mcu']
-        detailrs_mcu = request.form['detailrs_mcu']
+    nama_mcu = request.form['nama_mcu']
+    detailrs_mcu = request.form['detailrs_mcu']
 
-        doc = {
-            "nama_mcu": nama_mcu,
-            "detailrs_mcu": detailrs_mcu,
-            "user_id": payload["id"]
-        }
-        db.medical_checkup.insert_one(doc)
-        
-        return jsonify({'message': 'Data Berhasil Disimpan!', 'success': True})
-    except (jwt.ExpiredSignatureError, jwt.exceptions.DecodeError):
-        return jsonify({'message': 'Token tidak valid!'})
+    doc = {
+        "nama_mcu": nama_mcu,
+        "detailrs_mcu": detailrs_mcu,
+        "user_id": payload["id"]
+    }
+    db.medical_checkup.insert_one(doc)
+    ubah_statistik('medical_checkup', 1)
+    
+    return jsonify({'message': 'Data Berhasil Disimpan!', 'success': True})
 
 
 @app.route('/admin/detail/users')
@@ -503,7 +1947,7 @@ def detail_users():
     admininfo = get_admin_info()
     if not admininfo:
         return redirect(url_for("show_loginAdmin"))
-    admin_data = db.admin.find_one({'admin': admininfo['admin']})
+    admin_data = admininfo
     if admin_data:
         admin = admin_data.get('admin')
         password = admin_data.get('password')
@@ -514,60 +1958,123 @@ def detail_users():
 
 
 @app.route('/delete_mcu', methods=['POST'])
+@admin_api
 def delete_mcu():
     data = request.get_json()
     _id = data['_id']
 
     try:
-        db.medical_checkup.delete_one({"_id": ObjectId(_id)})
+        hapus = db.medical_checkup.delete_one({"_id": ObjectId(_id)})
+        ubah_statistik('medical_checkup', -hapus.deleted_count)
         return jsonify({"status": "success"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
 
 @app.route('/delete_user', methods=['POST'])
+@admin_api
 def delete_user():
     data = request.get_json()
     _id = data['_id']
 
     try:
-        db.users.delete_one({"_id": ObjectId(_id)})
-        # db.antrian.delete_many({'user_id': id})
-
-        return jsonify({"status": "success"})
+        user = db.users.find_one_and_delete({"_id": ObjectId(_id)}, projection={'nama': 1})
+        if not user:
+            return jsonify({"status": "success"})
+        ubah_statistik('users', -1)
+        invalidasi_identitas('user', user['nama'])
+        tugas = jalankan_tugas('hapus_data_user', [user['_id']])
+        return jsonify({"status": "success", "tugas": tugas})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
 
 @app.route('/delete_antrian', methods=['POST'])
+@admin_api
 def delete_antrian():
     data = request.get_json()
     _id = data['_id']
 
     try:
-        db.antrian.delete_one({"_id": ObjectId(_id)})
+        antrian = db.antrian.find_one_and_delete({"_id": ObjectId(_id)}, projection={'mcu': 1})
+        if antrian:
+            ubah_statistik('antrian', -1)
+            ubah_jumlah_antrian(antrian.get('mcu'), -1)
+        else:
+            # Arsip tidak tercatat di counter maupun jumlah per MCU
+            db.antrian_arsip.delete_one({"_id": ObjectId(_id)})
+        invalidasi_halaman('antrian')
+        HUB_ANTRIAN.publish()
         return jsonify({"status": "success"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
 
+ANTRIAN_PER_HALAMAN = 25
+ANTRIAN_HALAMAN_MAKS = 100
+ANTRIAN_URUTAN = [('tanggal', 1), ('sesi', 1), ('mcu', 1), ('nomor_antrian', 1)]
+
+
+def filter_antrian(args):
+    filter_query = {}
+    rentang = {}
+    if args.get('dari'):
+        rentang['$gte'] = datetime.strptime(args['dari'], '%Y-%m-%d')
+    if args.get('sampai'):
+        rentang['$lte'] = datetime.strptime(args['sampai'], '%Y-%m-%d')
+    if rentang:
+        filter_query['tanggal'] = rentang
+    if args.get('sesi'):
+        filter_query['sesi'] = args['sesi']
+    if args.get('mcu'):
+        filter_query['mcu'] = args['mcu']
+    return filter_query
+
+
+def cari_antrian_admin(filter_query, skip, limit):
+    # Antrian aktif dan arsip digabung dengan $unionWith. Tiap sisi sudah
+    # diurutkan dan dibatasi lewat index-nya sendiri, jadi yang digabung
+    # paling banyak 2 x (skip + limit) dokumen; halaman dibatasi
+    # ANTRIAN_HALAMAN_MAKS supaya skip tidak bisa dibuat sebesar koleksi.
+    urutan = dict(ANTRIAN_URUTAN)
+    tahap = [{'$match': filter_query}, {'$sort': urutan}, {'$limit': skip + limit}]
+    return list(db.antrian.aggregate(tahap + [
+        {'$unionWith': {'coll': 'antrian_arsip', 'pipeline': tahap}},
+        {'$sort': urutan},
+        {'$skip': skip},
+        {'$limit': limit},
+    ]))
+
+
 @app.route('/admin/detail/antrian')
 def detail_antrian():
-    informasi = get_user_data()
     admininfo = get_admin_info()
-    data_from_db = list(db.antrian.find({}))
-    for doc in data_from_db:
-        doc['tanggal'] = datetime.strptime(doc['tanggal'], '%d %b %Y')
-    sorted_data = sorted(data_from_db, key=lambda x: x['tanggal'])
-
     if not admininfo:
         return redirect(url_for("show_loginAdmin"))
-    admin_data = db.admin.find_one({'admin': admininfo['admin']})
-    if admin_data:
-        admin = admin_data.get('admin')
-        password = admin_data.get('password')
 
-        return render_template('admin/antrian.html', informasi=informasi, sorted_data=sorted_data, active_page="detail_antrian", admininfo=admininfo)
+    try:
+        filter_query = filter_antrian(request.args)
+    except ValueError:
+        filter_query = {}
+    per_halaman = min(max(request.args.get('per_halaman', ANTRIAN_PER_HALAMAN, type=int), 1), 100)
+
+    if filter_query:
+        total = db.antrian.count_documents(filter_query) + db.antrian_arsip.count_documents(filter_query)
+    else:
+        total = get_user_data()['jumlah_antrian']
+    # Halaman yang lebih dalam dicari lewat filter tanggal, bukan skip yang besar
+    jumlah_halaman = min(max((total + per_halaman - 1) // per_halaman, 1), ANTRIAN_HALAMAN_MAKS)
+    halaman = min(max(request.args.get('halaman', 1, type=int), 1), jumlah_halaman)
+    sorted_data = cari_antrian_admin(filter_query, (halaman - 1) * per_halaman, per_halaman)
+    pagination = {
+        'halaman': halaman,
+        'per_halaman': per_halaman,
+        'total': total,
+        'jumlah_halaman': jumlah_halaman,
+        'args': {k: v for k, v in request.args.items() if k != 'halaman' and v},
+    }
+
+    return render_template('admin/antrian.html', sorted_data=sorted_data, pagination=pagination, active_page="detail_antrian", admininfo=admininfo)
 
 
 @app.route('/admin/detail/mcu')
@@ -594,70 +2101,1159 @@ def hasil_mcu():
 def mcu():
     informasi = get_user_data()
     user_info = get_user_info()
-    all_users = get_all_users()
-    return render_template('admin/mcu.html', informasi=informasi, user_info=user_info, all_users=all_users)
+    return render_template('admin/mcu.html', informasi=informasi, user_info=user_info)
+
+
+# _________________ Hasil MCU ________________________________________________
+
+HASIL_MCU_FIELDS = [
+    'nama', 'tanggal_lahir', 'umur', 'jenis_kelamin', 'alamat', 'tanggal_pemeriksaan',
+    'berat_badan', 'tinggi_badan', 'tekanan_darah', 'kolesterol_total', 'kolesterol_hdl',
+    'kolesterol_ldl', 'gula_darah_puasa', 'gula_darah_sewaktu', 'gula_darah_sesudah_makan',
+    'warna_urine', 'kejernihan_urine', 'nitrit_urine', 'protein_urine', 'glukosa_urine'
+]
+HASIL_MCU_ANGKA = [
+    'umur', 'berat_badan', 'tinggi_badan', 'kolesterol_total', 'kolesterol_hdl', 'kolesterol_ldl',
+    'gula_darah_puasa', 'gula_darah_sewaktu', 'gula_darah_sesudah_makan'
+]
+# Field yang dihitung dari input, plus paket MCU yang boleh dikosongkan
+HASIL_MCU_TURUNAN = ['tekanan_sistolik', 'tekanan_diastolik', 'bmi', 'mcu']
+IMPOR_BATCH = 1000
+IMPOR_POTONGAN = 64 * 1024
+IMPOR_ELEMEN_MAKS = 1024 * 1024
+
+
+def angka(nilai):
+    if isinstance(nilai, (int, float)):
+        hasil = float(nilai)
+    else:
+        hasil = float(str(nilai).strip().replace(',', '.'))
+    # float() juga menerima 'nan', 'inf' dan '1e999'
+    if not math.isfinite(hasil):
+        raise ValueError(f'{nilai} bukan angka hingga')
+    return int(hasil) if hasil.is_integer() else hasil
+
+
+def parse_tanggal_pemeriksaan(nilai):
+    if isinstance(nilai, datetime):
+        return nilai
+    teks = str(nilai).strip()
+    for format_tanggal_input in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(teks, format_tanggal_input)
+        except ValueError:
+            pass
+    return parse_tanggal_antrian(teks)
+
+
+def ketik_hasil_mcu(doc):
+    for field in HASIL_MCU_ANGKA:
+        try:
+            doc[field] = angka(doc.get(field))
+        except (TypeError, ValueError):
+            raise ValueError(f'Nilai {field} harus berupa angka')
+
+    try:
+        sistolik, diastolik = (angka(bagian) for bagian in str(doc.get('tekanan_darah')).split('/'))
+    except ValueError:
+        raise ValueError('Tekanan darah harus berformat sistolik/diastolik, contoh 120/80')
+    doc['tekanan_darah'] = f'{sistolik}/{diastolik}'
+    doc['tekanan_sistolik'] = sistolik
+    doc['tekanan_diastolik'] = diastolik
+
+    try:
+        doc['tanggal_pemeriksaan'] = parse_tanggal_pemeriksaan(doc.get('tanggal_pemeriksaan'))
+    except (ValueError, KeyError):
+        raise ValueError('Tanggal pemeriksaan tidak valid')
+
+    if doc['tinggi_badan'] > 0:
+        doc['bmi'] = round(doc['berat_badan'] / (doc['tinggi_badan'] / 100) ** 2, 1)
+    return doc
+
+
+def validasi_hasil_mcu(data):
+    doc = {'user_id': data.get('user_id')}
+    for field in HASIL_MCU_FIELDS:
+        doc[field] = data.get(field)
+
+    if not all(doc.values()):
+        return None, 'Data MCU Kolesterol tidak lengkap'
+    if not ObjectId.is_valid(doc['user_id']):
+        return None, 'User tidak ditemukan'
+    try:
+        ketik_hasil_mcu(doc)
+    except ValueError as e:
+        return None, str(e)
+    if data.get('mcu'):
+        doc['mcu'] = data.get('mcu')
+    return doc, None
+
+
+def user_tidak_ditemukan(docs):
+    # Satu query $in per batch, bukan satu find_one per baris
+    ids = {doc['user_id'] for doc in docs}
+    ada = {str(user['_id']) for user in db.users.find({'_id': {'$in': [ObjectId(_id) for _id in ids]}}, {'_id': 1})}
+    return ids - ada
 
 
 @app.route('/save_hasil_mcu', methods=['POST'])
 def save_hasil_mcu():
+    payload = get_token_payload()
+    if not payload or not (get_admin_info(segar=True) or get_user_info(segar=True)):
+        return jsonify({'message': 'Token tidak valid!', 'success': False})
+
+    doc, error = validasi_hasil_mcu(request.form)
+    if error:
+        return jsonify({'message': error, 'success': False})
+    if user_tidak_ditemukan([doc]):
+        return jsonify({'message': 'User tidak ditemukan', 'success': False})
+
+    db.hasil_mcu.insert_one(doc)
+    ubah_statistik('hasil_mcu', 1)
+    perbarui_rollup([doc])
+
+    return jsonify({'message': 'Data Hasil MCU berhasil disimpan!', 'success': True})
+
+# _________________ Impor Hasil MCU ________________________________________________
+
+
+def baca_array_json(teks):
+    # '[' pembuka sudah dibaca. Elemen diurai satu per satu dengan raw_decode;
+    # buffer hanya berisi potongan yang belum terurai, bukan seluruh file.
+    decoder = json.JSONDecoder()
+    buffer, pos, habis = '', 0, False
+    harap = 'awal'  # awal: elemen atau ], pemisah: , atau ], elemen: wajib elemen
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos >= len(buffer):
+            if habis:
+                raise ValueError('Array JSON tidak ditutup dengan ]')
+            potongan = teks.read(IMPOR_POTONGAN)
+            habis = not potongan
+            buffer, pos = buffer[pos:] + potongan, 0
+            continue
+        if harap == 'pemisah':
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] != ',':
+                raise ValueError(f'Diharapkan , atau ] tetapi ditemukan {buffer[pos]!r}')
+            pos += 1
+            harap = 'elemen'
+            continue
+        if harap == 'awal' and buffer[pos] == ']':
+            return
+        try:
+            nilai, akhir = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            nilai, akhir = None, None
+        # Nilai yang menyentuh ujung buffer bisa saja terpotong (mis. angka)
+        if akhir is None or (akhir == len(buffer) and not habis):
+            # Elemen rusak tidak boleh membuat seluruh sisa file masuk buffer
+            if habis or len(buffer) - pos > IMPOR_ELEMEN_MAKS:
+                raise ValueError('Elemen array JSON tidak valid')
+            potongan = teks.read(IMPOR_POTONGAN)
+            habis = not potongan
+            buffer, pos = buffer[pos:] + potongan, 0
+            continue
+        yield nilai
+        pos, harap = akhir, 'pemisah'
+
+
+def baca_baris_impor(berkas, nama_berkas):
+    # CSV, NDJSON maupun array JSON dibaca bertahap supaya validasi berjalan
+    # sambil file dibaca dan memori tidak bergantung pada ukuran file.
+    teks = io.TextIOWrapper(berkas, encoding='utf-8-sig')
+    if nama_berkas.lower().endswith('.csv'):
+        yield from csv.DictReader(teks)
+        return
+
+    awal = teks.read(1)
+    while awal.isspace():
+        awal = teks.read(1)
+    if awal == '[':
+        yield from baca_array_json(teks)
+        return
+
+    # NDJSON: satu objek JSON per baris
+    sisa = awal + teks.readline()
+    while sisa:
+        if sisa.strip():
+            try:
+                yield json.loads(sisa)
+            except ValueError:
+                yield None
+        sisa = teks.readline()
+
+
+def impor_hasil_mcu(baris_data, batch=IMPOR_BATCH, ordered=False):
+    laporan = {'diproses': 0, 'disimpan': 0, 'gagal': []}
+    docs, nomor_docs = [], []
+
+    def simpan():
+        hilang = user_tidak_ditemukan(docs)
+        if hilang:
+            for nomor, doc in zip(nomor_docs, docs):
+                if doc['user_id'] in hilang:
+                    laporan['gagal'].append({'baris': nomor, 'message': 'User tidak ditemukan'})
+            nomor_docs[:] = [nomor for nomor, doc in zip(nomor_docs, docs) if doc['user_id'] not in hilang]
+            docs[:] = [doc for doc in docs if doc['user_id'] not in hilang]
+            if not docs:
+                return False
+        try:
+            db.hasil_mcu.insert_many(docs, ordered=ordered)
+            tersimpan = list(docs)
+            berhenti = False
+        except BulkWriteError as e:
+            gagal_index = {error['index'] for error in e.details['writeErrors']}
+            for error in e.details['writeErrors']:
+                laporan['gagal'].append({'baris': nomor_docs[error['index']], 'message': error['errmsg']})
+            if ordered:
+                tersimpan = docs[:e.details['nInserted']]
+            else:
+                tersimpan = [doc for index, doc in enumerate(docs) if index not in gagal_index]
+            berhenti = ordered
+        laporan['disimpan'] += len(tersimpan)
+        ubah_statistik('hasil_mcu', len(tersimpan))
+        perbarui_rollup(tersimpan)
+        docs.clear()
+        nomor_docs.clear()
+        return berhenti
+
+    for nomor, data in enumerate(baris_data, 1):
+        laporan['diproses'] = nomor
+        if not isinstance(data, dict):
+            laporan['gagal'].append({'baris': nomor, 'message': 'Format baris tidak valid'})
+            continue
+        doc, error = validasi_hasil_mcu(data)
+        if error:
+            laporan['gagal'].append({'baris': nomor, 'message': error})
+            continue
+        docs.append(doc)
+        nomor_docs.append(nomor)
+        if len(docs) >= batch and simpan():
+            return laporan
+    if docs:
+        simpan()
+    return laporan
+
+
+@app.route('/admin/hasil/impor', methods=['POST'])
+@admin_api
+def impor_hasil():
+    berkas = request.files.get('berkas')
+    if not berkas or not berkas.filename:
+        return jsonify({'result': 'error', 'message': 'File belum dipilih'}), 400
+
+    ordered = request.form.get('ordered') == '1'
     try:
-        token_receive = request.cookies.get("mytoken")
-        payload = jwt.decode(token_receive, SECRET_KEY, algorithms=["HS256"])
-
-        user_id = request.form.get('user_id')
-        nama = request.form.get('nama')
-        tanggal_lahir = request.form.get('tanggal_lahir')
-        umur = request.form.get('umur')
-        jenis_kelamin = request.form.get('jenis_kelamin')
-        alamat = request.form.get('alamat')
-        tanggal_pemeriksaan = request.form.get('tanggal_pemeriksaan')
-        berat_badan = request.form.get('berat_badan')
-        tinggi_badan = request.form.get('tinggi_badan')
-        tekanan_darah = request.form.get('tekanan_darah')
-        kolesterol_total = request.form.get('kolesterol_total')
-        kolesterol_hdl = request.form.get('kolesterol_hdl')
-        kolesterol_ldl = request.form.get('kolesterol_ldl')
-        gula_darah_puasa = request.form.get('gula_darah_puasa')
-        gula_darah_sewaktu = request.form.get('gula_darah_sewaktu')
-        gula_darah_sesudah_makan = request.form.get('gula_darah_sesudah_makan')
-        warna_urine = request.form.get('warna_urine')
-        kejernihan_urine = request.form.get('kejernihan_urine')
-        nitrit_urine = request.form.get('nitrit_urine')
-        protein_urine = request.form.get('protein_urine')
-        glukosa_urine = request.form.get('glukosa_urine')
-
-        if not (nama and tanggal_lahir and umur and jenis_kelamin and alamat and tanggal_pemeriksaan and berat_badan and tinggi_badan and tekanan_darah and kolesterol_total and kolesterol_hdl and kolesterol_ldl and gula_darah_puasa and gula_darah_sewaktu and gula_darah_sesudah_makan and warna_urine and kejernihan_urine and nitrit_urine and protein_urine and glukosa_urine and user_id):
-            return jsonify({'message': 'Data MCU Kolesterol tidak lengkap', 'success': False})
-
-        doc = {
-            "user_id": user_id,
-            "nama": nama,
-            "tanggal_lahir": tanggal_lahir,
-            "umur": umur,
-            "jenis_kelamin": jenis_kelamin,
-            "alamat": alamat,
-            "tanggal_pemeriksaan": tanggal_pemeriksaan,
-            "berat_badan": berat_badan,
-            "tinggi_badan": tinggi_badan,
-            "tekanan_darah": tekanan_darah,
-            "kolesterol_total": kolesterol_total,
-            "kolesterol_hdl": kolesterol_hdl,
-            "kolesterol_ldl": kolesterol_ldl,
-            "gula_darah_puasa": gula_darah_puasa,
-            "gula_darah_sewaktu": gula_darah_sewaktu,
-            "gula_darah_sesudah_makan": gula_darah_sesudah_makan,
-            "warna_urine": warna_urine,
-            "kejernihan_urine": kejernihan_urine,
-            "nitrit_urine": nitrit_urine,
-            "protein_urine": protein_urine,
-            "glukosa_urine": glukosa_urine
+        laporan = impor_hasil_mcu(baca_baris_impor(berkas.stream, berkas.filename), ordered=ordered)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'result': 'error', 'message': f'File tidak bisa dibaca: {e}'}), 400
+    return jsonify({'result': 'success', **laporan})
+
+
+@app.cli.command('impor-hasil-mcu')
+@click.argument('berkas', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch', default=IMPOR_BATCH, help='Jumlah dokumen per insert_many.')
+@click.option('--ordered', is_flag=True, help='Berhenti pada error tulis pertama.')
+def impor_hasil_mcu_command(berkas, batch, ordered):
+    with open(berkas, 'rb') as f:
+        laporan = impor_hasil_mcu(baca_baris_impor(f, berkas), batch=batch, ordered=ordered)
+    print(f'{laporan["disimpan"]} dari {laporan["diproses"]} baris disimpan')
+    for gagal in laporan['gagal']:
+        print(f'Baris {gagal["baris"]}: {gagal["message"]}')
+
+
+# _________________ Rollup Hasil MCU ________________________________________________
+
+# Batas mengikuti nilai rujukan umum; 'atas' berarti abnormal jika >= batas,
+# 'bawah' berarti abnormal jika < batas.
+METRIK_LAB = {
+    'kolesterol_total': {'atas': 200, 'lebar_histogram': 20},
+    'kolesterol_ldl': {'atas': 130, 'lebar_histogram': 20},
+    'kolesterol_hdl': {'bawah': 40, 'lebar_histogram': 10},
+    'gula_darah_puasa': {'atas': 126, 'lebar_histogram': 20},
+    'tekanan_sistolik': {'atas': 140, 'lebar_histogram': 10},
+    'tekanan_diastolik': {'atas': 90, 'lebar_histogram': 10},
+    'bmi': {'atas': 25, 'lebar_histogram': 5},
+    'berat_badan': {'lebar_histogram': 10},
+}
+TANPA_PAKET = 'Tanpa Paket'
+
+
+def abnormal(metrik, nilai):
+    batas = METRIK_LAB[metrik]
+    return ('atas' in batas and nilai >= batas['atas']) or ('bawah' in batas and nilai < batas['bawah'])
+
+
+def kunci_rollup(doc):
+    if not isinstance(doc.get('tanggal_pemeriksaan'), datetime):
+        return None
+    return doc.get('mcu') or TANPA_PAKET, doc['tanggal_pemeriksaan'].strftime('%Y-%m')
+
+
+def kumpulkan_rollup(docs):
+    # Semua dokumen dalam satu batch digabung dulu per (paket, bulan), jadi
+    # impor 1000 baris tetap hanya beberapa update ke koleksi rollup.
+    rollup = {}
+    for doc in docs:
+        kunci = kunci_rollup(doc)
+        if kunci is None:
+            continue
+        mcu, bulan = kunci
+        item = rollup.setdefault(f'{mcu}|{bulan}', {
+            'set': {'mcu': mcu, 'bulan': bulan}, 'inc': {'jumlah': 0}, 'min': {}, 'max': {}
+        })
+        item['inc']['jumlah'] += 1
+        for metrik, config in METRIK_LAB.items():
+            nilai = doc.get(metrik)
+            if not isinstance(nilai, (int, float)) or not math.isfinite(nilai):
+                continue
+            bucket = int(nilai // config['lebar_histogram'] * config['lebar_histogram'])
+            for field, tambah in (
+                (f'metrik.{metrik}.n', 1),
+                (f'metrik.{metrik}.total', nilai),
+                (f'metrik.{metrik}.total_kuadrat', nilai * nilai),
+                (f'metrik.{metrik}.abnormal', int(abnormal(metrik, nilai))),
+                (f'metrik.{metrik}.histogram.{bucket}', 1),
+            ):
+                item['inc'][field] = item['inc'].get(field, 0) + tambah
+            field = f'metrik.{metrik}.min'
+            item['min'][field] = min(item['min'].get(field, nilai), nilai)
+            field = f'metrik.{metrik}.max'
+            item['max'][field] = max(item['max'].get(field, nilai), nilai)
+    return rollup
+
+
+def perbarui_rollup(docs):
+    operasi = []
+    for kunci, item in kumpulkan_rollup(docs).items():
+        update = {'$setOnInsert': item['set'], '$inc': item['inc']}
+        if item['min']:
+            update['$min'] = item['min']
+            update['$max'] = item['max']
+        operasi.append(UpdateOne({'_id': kunci}, update, upsert=True))
+    if operasi:
+        db.rollup_hasil_mcu.bulk_write(operasi, ordered=False)
+
+
+def kurangi_rollup(docs):
+    # Kebalikan perbarui_rollup untuk hasil MCU yang dihapus. Jumlah, total dan
+    # histogram cukup dikurangi lewat $inc sehingga aman bersamaan dengan impor;
+    # min/max baru dihitung ulang bila nilai yang dihapus adalah batasnya.
+    for kunci, item in kumpulkan_rollup(docs).items():
+        rollup = db.rollup_hasil_mcu.find_one_and_update(
+            {'_id': kunci}, {'$inc': {field: -nilai for field, nilai in item['inc'].items()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if rollup is None:
+            continue
+        if rollup['jumlah'] <= 0:
+            db.rollup_hasil_mcu.delete_one({'_id': kunci, 'jumlah': {'$lte': 0}})
+            continue
+        metrik = rollup.get('metrik', {})
+        if any(
+            metrik[nama]['n'] <= 0
+            or item['min'][f'metrik.{nama}.min'] <= metrik[nama]['min']
+            or item['max'][f'metrik.{nama}.max'] >= metrik[nama]['max']
+            for nama in METRIK_LAB if f'metrik.{nama}.min' in item['min']
+        ):
+            hitung_ulang_batas_rollup(rollup)
+
+
+def filter_rollup(mcu, bulan):
+    awal = datetime.strptime(bulan, '%Y-%m')
+    return {
+        'mcu': {'$in': [None, '', TANPA_PAKET]} if mcu == TANPA_PAKET else mcu,
+        'tanggal_pemeriksaan': {'$gte': awal, '$lt': (awal + timedelta(days=32)).replace(day=1)},
+    }
+
+
+def hitung_ulang_rollup_bucket(mcu, bulan):
+    projection = {field: 1 for field in ['mcu', 'tanggal_pemeriksaan', *METRIK_LAB]}
+    docs = list(db.hasil_mcu.find(filter_rollup(mcu, bulan), projection))
+    db.rollup_hasil_mcu.delete_one({'_id': f'{mcu}|{bulan}'})
+    perbarui_rollup(docs)
+
+
+def hitung_ulang_batas_rollup(rollup, percobaan=5):
+    filter_query = filter_rollup(rollup['mcu'], rollup['bulan'])
+    for _ in range(percobaan):
+        batas = {}
+        for doc in db.hasil_mcu.find(filter_query, {nama: 1 for nama in METRIK_LAB}):
+            for nama in METRIK_LAB:
+                nilai = doc.get(nama)
+                if isinstance(nilai, (int, float)) and math.isfinite(nilai):
+                    bawah, atas = batas.get(nama, (nilai, nilai))
+                    batas[nama] = (min(bawah, nilai), max(atas, nilai))
+        update = {}
+        if batas:
+            update['$set'] = {f'metrik.{nama}.{field}': nilai for nama, (bawah, atas) in batas.items()
+                              for field, nilai in (('min', bawah), ('max', atas))}
+        if len(batas) < len(METRIK_LAB):
+            update['$unset'] = {f'metrik.{nama}': '' for nama in METRIK_LAB if nama not in batas}
+        # Hanya ditulis bila tidak ada impor/penghapusan lain di bucket ini sejak
+        # dibaca; kalau ada, $min/$max mereka bisa tertimpa, jadi hitung ulang.
+        if db.rollup_hasil_mcu.update_one({'_id': rollup['_id'], 'jumlah': rollup['jumlah']}, update).matched_count:
+            return True
+        rollup = db.rollup_hasil_mcu.find_one({'_id': rollup['_id']})
+        if rollup is None:
+            return True
+    app.logger.warning('Batas rollup %s gagal dihitung ulang', rollup['_id'])
+    return False
+
+
+def ringkas_rollup(doc):
+    metrik = {}
+    for nama, data in doc.get('metrik', {}).items():
+        n = data['n']
+        rata_rata = data['total'] / n
+        metrik[nama] = {
+            'n': n,
+            'rata_rata': round(rata_rata, 2),
+            'simpangan_baku': round(max(data['total_kuadrat'] / n - rata_rata ** 2, 0) ** 0.5, 2),
+            'min': data['min'],
+            'max': data['max'],
+            'abnormal': data['abnormal'],
+            'persen_abnormal': round(data['abnormal'] * 100 / n, 1),
+            'histogram': dict(sorted(data['histogram'].items(), key=lambda item: float(item[0]))),
         }
-        db.hasil_mcu.insert_one(doc)
+    return {'mcu': doc['mcu'], 'bulan': doc['bulan'], 'jumlah': doc['jumlah'], 'metrik': metrik}
 
-        return jsonify({'message': 'Data Hasil MCU berhasil disimpan!', 'success': True})
-    except (jwt.ExpiredSignatureError, jwt.exceptions.DecodeError):
-        return jsonify({'message': 'Token tidak valid!', 'success': False})
+
+def bangun_ulang_rollup(batch=IMPOR_BATCH):
+    db.rollup_hasil_mcu.delete_many({})
+    projection = {field: 1 for field in ['mcu', 'tanggal_pemeriksaan', *METRIK_LAB]}
+    docs, jumlah = [], 0
+    for doc in db.hasil_mcu.find({}, projection).batch_size(batch):
+        docs.append(doc)
+        if len(docs) >= batch:
+            perbarui_rollup(docs)
+            jumlah += len(docs)
+            docs = []
+    perbarui_rollup(docs)
+    return jumlah + len(docs)
+
+
+@app.cli.command('bangun-rollup-hasil-mcu')
+def bangun_rollup_hasil_mcu():
+    print(f'{bangun_ulang_rollup()} hasil MCU masuk ke rollup')
+
+
+@app.cli.command('migrasi-hasil-mcu')
+@click.option('--batch', default=IMPOR_BATCH, help='Jumlah dokumen per bulk_write.')
+def migrasi_hasil_mcu(batch):
+    diubah, gagal, operasi = 0, [], []
+    for doc in db.hasil_mcu.find({'tekanan_sistolik': {'$exists': False}}):
+        try:
+            ketik_hasil_mcu(doc)
+        except ValueError as e:
+            gagal.append((doc['_id'], str(e)))
+            continue
+        operasi.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+            field: doc[field] for field in [*HASIL_MCU_ANGKA, *HASIL_MCU_TURUNAN, 'tekanan_darah', 'tanggal_pemeriksaan']
+            if field in doc
+        }}))
+        if len(operasi) >= batch:
+            diubah += db.hasil_mcu.bulk_write(operasi, ordered=False).modified_count
+            operasi = []
+    if operasi:
+        diubah += db.hasil_mcu.bulk_write(operasi, ordered=False).modified_count
+
+    bangun_ulang_rollup(batch)
+    print(f'{diubah} hasil MCU dimigrasi')
+    for _id, message in gagal:
+        print(f'Gagal: {_id} {message}')
+
+
+@app.route('/api/admin/analitik')
+@admin_api
+def api_admin_analitik():
+    filter_query = {}
+    if request.args.get('mcu'):
+        filter_query['mcu'] = request.args['mcu']
+    rentang = {}
+    if request.args.get('dari'):
+        rentang['$gte'] = request.args['dari']
+    if request.args.get('sampai'):
+        rentang['$lte'] = request.args['sampai']
+    if rentang:
+        filter_query['bulan'] = rentang
+
+    data = [ringkas_rollup(doc) for doc in db.rollup_hasil_mcu.find(filter_query).sort([('bulan', 1), ('mcu', 1)])]
+    batas = {metrik: {k: v for k, v in config.items() if k != 'lebar_histogram'} for metrik, config in METRIK_LAB.items()}
+    return jsonify({'result': 'success', 'batas': batas, 'data': data})
+
+
+# _________________ Riwayat Hasil MCU ________________________________________________
+
+HASIL_MCU_URUTAN = [('tanggal_pemeriksaan', -1), ('_id', -1)]
+RIWAYAT_PER_HALAMAN = 10
+RIWAYAT_PER_HALAMAN_MAKS = 50
+TREN_METRIK = ['kolesterol_total', 'gula_darah_puasa', 'berat_badan']
+TREN_METRIK_BOLEH = HASIL_MCU_ANGKA + ['tekanan_sistolik', 'tekanan_diastolik', 'bmi']
+TREN_KUNJUNGAN = 20
+TREN_KUNJUNGAN_MAKS = 100
+
+
+def encode_lanjut_riwayat(doc):
+    # Hasil lama yang belum lewat 'migrasi-hasil-mcu' masih menyimpan tanggal
+    # sebagai string (atau tanpa tanggal), jadi tipe nilainya ikut disimpan.
+    tanggal = doc.get('tanggal_pemeriksaan')
+    if isinstance(tanggal, datetime):
+        kunci = f'd|{tanggal.isoformat()}|{doc["_id"]}'
+    elif isinstance(tanggal, str):
+        kunci = f's|{tanggal}|{doc["_id"]}'
+    else:
+        kunci = f'n||{doc["_id"]}'
+    return base64.urlsafe_b64encode(kunci.encode()).decode().rstrip('=')
+
+
+def decode_lanjut_riwayat(token):
+    teks = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    jenis, sisa = teks.split('|', 1)
+    if jenis not in ('d', 's', 'n'):
+        raise ValueError('Jenis token tidak dikenal')
+    nilai, _id = sisa.rsplit('|', 1)
+    if jenis == 'd':
+        nilai = datetime.fromisoformat(nilai)
+    elif jenis == 'n':
+        nilai = None
+    return nilai, ObjectId(_id)
+
+
+def filter_lanjut_riwayat(tanggal, _id):
+    # Urutan menurun MongoDB: tanggal, lalu string, lalu null/tidak ada
+    field = 'tanggal_pemeriksaan'
+    sama = {field: tanggal, '_id': {'$lt': _id}}
+    if tanggal is None:
+        return [sama]
+    lebih_lama = [{field: {'$lt': tanggal}}, sama]
+    if isinstance(tanggal, datetime):
+        lebih_lama.append({field: {'$type': 'string'}})
+    return lebih_lama + [{field: None}]
+
+
+@app.route('/api/hasil_mcu/terbaru')
+@user_api
+def api_hasil_mcu_terbaru():
+    doc = db.hasil_mcu.find_one({'user_id': str(get_user_info()['_id'])}, PROJECTION_HASIL_MCU, sort=HASIL_MCU_URUTAN)
+    return jsonify({'result': 'success', 'data': doc})
+
+
+@app.route('/api/hasil_mcu')
+@user_api
+def api_hasil_mcu():
+    # Keyset di atas (tanggal_pemeriksaan, _id) menurun, sesuai index
+    # user_tanggal_pemeriksaan, supaya halaman belakang tidak memakai skip.
+    filter_query = {'user_id': str(get_user_info()['_id'])}
+    limit = min(max(request.args.get('limit', RIWAYAT_PER_HALAMAN, type=int), 1), RIWAYAT_PER_HALAMAN_MAKS)
+    lanjut = request.args.get('lanjut')
+    if lanjut:
+        try:
+            tanggal, _id = decode_lanjut_riwayat(lanjut)
+        except (ValueError, TypeError, InvalidId, UnicodeDecodeError):
+            return jsonify({'result': 'error', 'message': 'Token halaman tidak valid'}), 400
+        filter_query['$or'] = filter_lanjut_riwayat(tanggal, _id)
+
+    data = list(db.hasil_mcu.find(filter_query, PROJECTION_HASIL_MCU).sort(HASIL_MCU_URUTAN).limit(limit + 1))
+    ada_lagi = len(data) > limit
+    data = data[:limit]
+    return jsonify({
+        'result': 'success',
+        'data': data,
+        'lanjut': encode_lanjut_riwayat(data[-1]) if ada_lagi else None
+    })
+
+
+@app.route('/api/hasil_mcu/tren')
+@user_api
+def api_hasil_mcu_tren():
+    metrik = [m for m in request.args.get('metrik', '').split(',') if m] or TREN_METRIK
+    salah = [m for m in metrik if m not in TREN_METRIK_BOLEH]
+    if salah:
+        return jsonify({'result': 'error', 'message': f'Metrik tidak dikenal: {", ".join(salah)}'}), 400
+    limit = min(max(request.args.get('limit', TREN_KUNJUNGAN, type=int), 1), TREN_KUNJUNGAN_MAKS)
+
+    projection = {'_id': 0, 'tanggal_pemeriksaan': 1, **{m: 1 for m in metrik}}
+    data = list(db.hasil_mcu.find({'user_id': str(get_user_info()['_id'])}, projection).sort(HASIL_MCU_URUTAN).limit(limit))
+    data.reverse()
+    return jsonify({
+        'result': 'success',
+        'metrik': metrik,
+        'tanggal': [doc.get('tanggal_pemeriksaan') for doc in data],
+        'seri': {m: [doc.get(m) for doc in data] for m in metrik},
+    })
+
+
+# _________________ API Admin ________________________________________________
+
+HALAMAN_API = 50
+HALAMAN_API_MAKS = 200
+PROJECTION_USER = {'nama': 1, 'jenis_kelamin': 1, 'alamat': 1}
+PROJECTION_MCU = {'nama_mcu': 1, 'detailrs_mcu': 1}
+PROJECTION_HASIL_MCU = {field: 1 for field in HASIL_MCU_FIELDS + HASIL_MCU_TURUNAN}
+
+
+def encode_lanjut(_id):
+    return base64.urlsafe_b64encode(_id.binary).decode().rstrip('=')
+
+
+def decode_lanjut(token):
+    return ObjectId(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+
+
+def halaman_keyset(koleksi, projection, filter_query=None):
+    # Keyset di atas _id: setiap halaman satu range scan index _id, tidak ada
+    # skip yang makin mahal di halaman belakang.
+    filter_query = dict(filter_query or {})
+    limit = min(max(request.args.get('limit', HALAMAN_API, type=int), 1), HALAMAN_API_MAKS)
+    lanjut = request.args.get('lanjut')
+    if lanjut:
+        try:
+            filter_query['_id'] = {'$gt': decode_lanjut(lanjut)}
+        except (ValueError, TypeError, InvalidId):
+            return jsonify({'result': 'error', 'message': 'Token halaman tidak valid'}), 400
+
+    data = list(db[koleksi].find(filter_query, projection).sort('_id', 1).limit(limit + 1))
+    ada_lagi = len(data) > limit
+    data = data[:limit]
+
+    return jsonify({
+        'result': 'success',
+        'data': data,
+        'lanjut': encode_lanjut(data[-1]['_id']) if ada_lagi else None
+    })
+
+
+@app.route('/api/admin/users')
+@admin_api
+def api_admin_users():
+    return halaman_keyset('users', PROJECTION_USER)
+
+
+@app.route('/api/admin/hasil_mcu')
+@admin_api
+def api_admin_hasil_mcu():
+    return halaman_keyset('hasil_mcu', PROJECTION_HASIL_MCU)
+
+
+@app.route('/api/admin/mcu')
+@admin_api
+def api_admin_mcu():
+    return halaman_keyset('medical_checkup', PROJECTION_MCU)
+
+
+@app.route('/api/admin/cache')
+@admin_api
+def api_admin_cache():
+    return jsonify({
+        'result': 'success',
+        'token': TOKEN_CACHE.info(),
+        'identitas': IDENTITAS_CACHE.info(),
+        'halaman': RENDER_CACHE.info(),
+    })
+
+
+@app.route('/api/admin/mongo-lambat')
+@admin_api
+def api_admin_mongo_lambat():
+    return jsonify({'result': 'success', 'batas_ms': muat_konfigurasi()['MONGO_LAMBAT_MS'], 'data': list(MONGO_LAMBAT)})
+
+
+# _________________ Pencarian User ________________________________________________
+
+CARI_USER_LIMIT = 10
+CARI_USER_LIMIT_MAKS = 50
+
+
+def normal_nama(nama):
+    # Huruf kecil, tanpa aksen dan spasi ganda, supaya regex prefix '^...'
+    # bisa memakai index nama_normal secara langsung.
+    teks = unicodedata.normalize('NFKD', nama or '')
+    teks = ''.join(huruf for huruf in teks if not unicodedata.combining(huruf))
+    return ' '.join(teks.casefold().split())
+
+
+@app.cli.command('migrasi-nama-normal')
+@click.option('--batch', default=IMPOR_BATCH, help='Jumlah dokumen per bulk_write.')
+def migrasi_nama_normal(batch):
+    diubah, operasi = 0, []
+    for user in db.users.find({'nama_normal': {'$exists': False}}, {'nama': 1}):
+        operasi.append(UpdateOne({'_id': user['_id']}, {'$set': {'nama_normal': normal_nama(user.get('nama'))}}))
+        if len(operasi) >= batch:
+            diubah += db.users.bulk_write(operasi, ordered=False).modified_count
+            operasi = []
+    if operasi:
+        diubah += db.users.bulk_write(operasi, ordered=False).modified_count
+    print(f'{diubah} user diberi nama_normal')
+
+
+@app.route('/api/admin/users/cari')
+@admin_api
+def api_admin_cari_user():
+    kata = normal_nama(request.args.get('q'))
+    if not kata:
+        return jsonify({'result': 'success', 'data': []})
+    limit = min(max(request.args.get('limit', CARI_USER_LIMIT, type=int), 1), CARI_USER_LIMIT_MAKS)
+    data = db.users.find({'nama_normal': {'$regex': '^' + re.escape(kata)}}, {'nama': 1}).sort('nama_normal', 1).limit(limit)
+    return jsonify({'result': 'success', 'data': list(data)})
+
+
+# _________________ Ekspor Data ________________________________________________
+
+EKSPOR_BATCH = 500
+EKSPOR_BATCH_MAKS = 5000
+EKSPOR = {
+    'users': {
+        'fields': ['_id', 'nama', 'jenis_kelamin', 'alamat'],
+        'tanggal': '_id',
+        'user_id': '_id',
+    },
+    'antrian': {
+        'fields': ['_id', 'user_id', 'nama', 'nomor_antrian', 'hari', 'tanggal', 'jam', 'sesi', 'mcu'],
+        'tanggal': 'tanggal',
+        'user_id': 'user_id',
+        'arsip': 'antrian_arsip',
+    },
+    'hasil_mcu': {
+        'fields': ['_id', 'user_id'] + HASIL_MCU_FIELDS + HASIL_MCU_TURUNAN,
+        'tanggal': 'tanggal_pemeriksaan',
+        'user_id': 'user_id',
+    },
+}
+
+
+def filter_ekspor(koleksi, dari=None, sampai=None, user_id=None):
+    config = EKSPOR[koleksi]
+    filter_query = {}
+    rentang = {}
+    if dari:
+        rentang['$gte'] = datetime.strptime(dari, '%Y-%m-%d')
+    if sampai:
+        rentang['$lt'] = datetime.strptime(sampai, '%Y-%m-%d') + timedelta(days=1)
+    if rentang:
+        if config['tanggal'] == '_id':
+            rentang = {op: ObjectId.from_datetime(nilai) for op, nilai in rentang.items()}
+        filter_query[config['tanggal']] = rentang
+    if user_id:
+        # antrian.user_id dan users._id berupa ObjectId, hasil_mcu.user_id berupa string
+        filter_query[config['user_id']] = user_id if koleksi == 'hasil_mcu' else ObjectId(user_id)
+    return filter_query
+
+
+def nilai_ekspor(nilai):
+    if isinstance(nilai, datetime):
+        return nilai.strftime('%Y-%m-%d')
+    if isinstance(nilai, ObjectId):
+        return str(nilai)
+    return nilai
+
+
+def baris_ekspor(koleksi, filter_query, format_ekspor='csv', batch=EKSPOR_BATCH):
+    # Cursor dibaca per batch dan hasilnya dikirim per potongan, jadi memori
+    # tetap kecil berapapun jumlah dokumennya.
+    fields = EKSPOR[koleksi]['fields']
+    # Arsip (data lama) dulu, baru koleksi aktif
+    sumber = [EKSPOR[koleksi]['arsip'], koleksi] if 'arsip' in EKSPOR[koleksi] else [koleksi]
+    cursor = itertools.chain.from_iterable(
+        db[nama].find(filter_query, {field: 1 for field in fields}).sort('_id', 1).batch_size(batch) for nama in sumber
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format_ekspor == 'csv':
+        writer.writerow(fields)
+
+    for nomor, doc in enumerate(cursor, 1):
+        baris = [nilai_ekspor(doc.get(field)) for field in fields]
+        if format_ekspor == 'csv':
+            writer.writerow(baris)
+        else:
+            buffer.write(json.dumps(dict(zip(fields, baris)), ensure_ascii=False) + '\n')
+        if nomor % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@app.route('/admin/export/<koleksi>')
+@admin_api
+def ekspor(koleksi):
+    format_ekspor = request.args.get('format', 'csv')
+    if koleksi not in EKSPOR or format_ekspor not in ('csv', 'ndjson'):
+        return jsonify({'result': 'error', 'message': 'Ekspor tidak dikenal'}), 404
+    try:
+        filter_query = filter_ekspor(koleksi, request.args.get('dari'), request.args.get('sampai'), request.args.get('user_id'))
+    except (ValueError, InvalidId):
+        return jsonify({'result': 'error', 'message': 'Filter tidak valid'}), 400
+    batch = min(max(request.args.get('batch', EKSPOR_BATCH, type=int), 1), EKSPOR_BATCH_MAKS)
+
+    mimetype = 'text/csv' if format_ekspor == 'csv' else 'application/x-ndjson'
+    return Response(
+        baris_ekspor(koleksi, filter_query, format_ekspor, batch),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={koleksi}.{format_ekspor}'}
+    )
+
+
+@app.cli.command('ekspor')
+@click.argument('koleksi', type=click.Choice(list(EKSPOR)))
+@click.option('--format', 'format_ekspor', default='csv', type=click.Choice(['csv', 'ndjson']))
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='File tujuan (default stdout).')
+@click.option('--dari', help='Tanggal awal YYYY-MM-DD.')
+@click.option('--sampai', help='Tanggal akhir YYYY-MM-DD.')
+@click.option('--user-id', help='Hanya data milik user ini.')
+@click.option('--batch', default=EKSPOR_BATCH)
+def ekspor_command(koleksi, format_ekspor, output, dari, sampai, user_id, batch):
+    filter_query = filter_ekspor(koleksi, dari, sampai, user_id)
+    for potongan in baris_ekspor(koleksi, filter_query, format_ekspor, batch):
+        output.write(potongan)
+
+
+# _________________ Tugas Latar ________________________________________________
+
+TUGAS_PERCOBAAN = 3
+
+_tugas = {'pid': None, 'executor': None, 'pemulihan': None}
+_tugas_aktif = threading.local()
+_tugas_lock = threading.Lock()
+
+
+def executor_tugas():
+    # Thread tidak ikut ter-fork, jadi setiap worker membuat pool-nya sendiri
+    if _tugas['pid'] != os.getpid():
+        with _tugas_lock:
+            if _tugas['pid'] != os.getpid():
+                pekerja = muat_konfigurasi()['TUGAS_PEKERJA']
+                _tugas['executor'] = ThreadPoolExecutor(max_workers=pekerja, thread_name_prefix='tugas')
+                _tugas['pid'] = os.getpid()
+    return _tugas['executor']
+
+
+def jalankan_tugas(jenis, *args):
+    # Status dan argumen disimpan di MongoDB, bukan di memori, supaya polling
+    # terjawab dari worker mana pun dan tugas bisa diulang bila worker-nya mati.
+    _id = uuid.uuid4().hex
+    sekarang = datetime.utcnow()
+    db.tugas.insert_one({
+        '_id': _id, 'jenis': jenis, 'args': list(args), 'status': 'antri', 'percobaan': 1,
+        'dibuat_pada': sekarang, 'diperbarui_pada': sekarang,
+    })
+    executor_tugas().submit(kerjakan_tugas, _id, jenis, args)
+    return _id
+
+
+def kerjakan_tugas(_id, jenis, args):
+    _tugas_aktif.id = _id
+    db.tugas.update_one({'_id': _id}, {'$set': {'status': 'berjalan', 'mulai_pada': datetime.utcnow(), 'diperbarui_pada': datetime.utcnow()}})
+    try:
+        perubahan = {'status': 'selesai', 'hasil': TUGAS_JENIS[jenis](*args)}
+    except Exception as e:
+        app.logger.exception('Tugas %s gagal', _id)
+        perubahan = {'status': 'gagal', 'error': str(e)}
+    perubahan['selesai_pada'] = perubahan['diperbarui_pada'] = datetime.utcnow()
+    db.tugas.update_one({'_id': _id}, {'$set': perubahan})
+    _tugas_aktif.id = None
+
+
+def denyut_tugas():
+    # Tugas panjang melaporkan kemajuan supaya tidak dianggap terhenti oleh
+    # pulihkan_tugas() lalu dijalankan dua kali bersamaan
+    _id = getattr(_tugas_aktif, 'id', None)
+    if _id:
+        db.tugas.update_one({'_id': _id, 'status': 'berjalan'}, {'$set': {'diperbarui_pada': datetime.utcnow()}})
+
+
+def pulihkan_tugas():
+    # Tugas yang worker-nya mati atau didaur ulang (max_requests) tertinggal di
+    # status antri/berjalan. Semua jenis tugas aman diulang, jadi tugas yang
+    # terlalu lama tidak bergerak diambil alih lagi, maksimal TUGAS_PERCOBAAN kali.
+    konfigurasi = muat_konfigurasi()
+    batas = datetime.utcnow() - timedelta(seconds=konfigurasi['TUGAS_PULIH_DETIK'])
+    dipulihkan = []
+    while True:
+        tugas = db.tugas.find_one_and_update(
+            {'status': {'$in': ['antri', 'berjalan']}, 'diperbarui_pada': {'$lt': batas}},
+            {'$set': {'status': 'antri', 'diperbarui_pada': datetime.utcnow()}, '$inc': {'percobaan': 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if tugas is None:
+            break
+        if tugas['percobaan'] > TUGAS_PERCOBAAN or tugas['jenis'] not in TUGAS_JENIS:
+            db.tugas.update_one({'_id': tugas['_id']}, {'$set': {
+                'status': 'gagal', 'error': 'Tugas terhenti dan tidak bisa dipulihkan', 'selesai_pada': datetime.utcnow(),
+            }})
+            continue
+        executor_tugas().submit(kerjakan_tugas, tugas['_id'], tugas['jenis'], tugas['args'])
+        dipulihkan.append(tugas['_id'])
+    return dipulihkan
+
+
+def pulihkan_tugas_berkala(interval):
+    while True:
+        try:
+            pulihkan_tugas()
+        except Exception as e:
+            app.logger.warning('Pemulihan tugas latar gagal: %s', e)
+        time.sleep(interval)
+
+
+@app.before_request
+def mulai_pemulihan_tugas():
+    # Pemulihan baru dimulai setelah request pertama dan berjalan di thread
+    # sendiri, jadi create_app() tetap tidak menyentuh MongoDB saat worker boot.
+    if _tugas['pemulihan'] != os.getpid():
+        with _tugas_lock:
+            if _tugas['pemulihan'] != os.getpid():
+                _tugas['pemulihan'] = os.getpid()
+                interval = muat_konfigurasi()['TUGAS_PULIH_INTERVAL']
+                if interval > 0:
+                    threading.Thread(target=pulihkan_tugas_berkala, args=(interval,), name='pulihkan-tugas', daemon=True).start()
+
+
+@app.cli.command('pulihkan-tugas')
+def pulihkan_tugas_command():
+    dipulihkan = pulihkan_tugas()
+    # Executor CLI baru selesai setelah semua tugas yang dipulihkan dijalankan
+    executor_tugas().shutdown(wait=True)
+    print(f'{len(dipulihkan)} tugas dipulihkan')
+
+
+@app.route('/api/admin/tugas/<_id>')
+@admin_api
+def api_admin_tugas(_id):
+    tugas = db.tugas.find_one({'_id': _id}, {'args': 0})
+    if tugas is None:
+        return jsonify({'result': 'error', 'message': 'Tugas tidak ditemukan'}), 404
+    return jsonify({'result': 'success', 'data': tugas})
+
+# _________________ Hapus Massal ________________________________________________
+
+HAPUS_MAKS = 1000
+
+
+def ids_hapus():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('_ids')
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('_ids wajib berisi daftar id')
+    if len(ids) > HAPUS_MAKS:
+        raise ValueError(f'Maksimal {HAPUS_MAKS} id per permintaan')
+    try:
+        return list(dict.fromkeys(ObjectId(_id) for _id in ids))
+    except (InvalidId, TypeError):
+        raise ValueError('ID tidak valid')
+
+
+def hapus_data_user(ids):
+    # Dijalankan di tugas latar setelah dokumen user-nya terhapus; user dengan
+    # riwayat panjang tidak lagi menahan worker web selama penghapusan. Dokumen
+    # dihapus per batch dengan delete_many dan ringkasannya langsung dikurangi
+    # sesudah batch itu, jadi bila proses mati paling banyak satu batch yang
+    # counternya tertinggal, dan pengulangan oleh pulihkan_tugas() hanya
+    # menghitung dokumen yang benar-benar ia hapus.
+    hasil = {'antrian': 0, 'hasil_mcu': 0}
+    filter_antrian = {'user_id': {'$in': ids}}
+    while True:
+        docs = list(db.antrian.find(filter_antrian, {'mcu': 1}).limit(IMPOR_BATCH))
+        if not docs:
+            break
+        terhapus = 0
+        for mcu in {doc.get('mcu') for doc in docs}:
+            jumlah = db.antrian.delete_many({'_id': {'$in': [doc['_id'] for doc in docs if doc.get('mcu') == mcu]}, 'mcu': mcu}).deleted_count
+            ubah_jumlah_antrian(mcu, -jumlah)
+            terhapus += jumlah
+        ubah_statistik('antrian', -terhapus)
+        hasil['antrian'] += terhapus
+        denyut_tugas()
+    hasil['antrian_arsip'] = db.antrian_arsip.delete_many(filter_antrian).deleted_count
+
+    projection = {field: 1 for field in ['mcu', 'tanggal_pemeriksaan', *METRIK_LAB]}
+    filter_hasil = {'user_id': {'$in': [str(_id) for _id in ids]}}
+    while True:
+        docs = list(db.hasil_mcu.find(filter_hasil, projection).limit(IMPOR_BATCH))
+        if not docs:
+            break
+        terhapus = 0
+        # Dihapus per bucket rollup: bila jumlahnya pas, dokumen yang terhapus
+        # pasti dokumen ini; bila tidak, ada penghapus lain dan bucket dihitung ulang.
+        per_bucket = {}
+        for doc in docs:
+            per_bucket.setdefault(kunci_rollup(doc), []).append(doc)
+        for kunci, docs_bucket in per_bucket.items():
+            jumlah = db.hasil_mcu.delete_many({'_id': {'$in': [doc['_id'] for doc in docs_bucket]}}).deleted_count
+            if jumlah == len(docs_bucket):
+                kurangi_rollup(docs_bucket)
+            elif kunci is not None:
+                hitung_ulang_rollup_bucket(*kunci)
+            terhapus += jumlah
+        ubah_statistik('hasil_mcu', -terhapus)
+        hasil['hasil_mcu'] += terhapus
+        denyut_tugas()
+
+    if hasil['antrian']:
+        invalidasi_halaman('antrian')
+        HUB_ANTRIAN.publish()
+    return hasil
+
+
+TUGAS_JENIS = {
+    'hapus_data_user': hapus_data_user,
+}
+
+
+@app.route('/api/admin/users/hapus', methods=['POST'])
+@admin_api
+def api_admin_hapus_users():
+    try:
+        ids = ids_hapus()
+    except ValueError as e:
+        return jsonify({'result': 'error', 'message': str(e)}), 400
+
+    # Akun langsung dihapus supaya token user tidak berlaku lagi; antrian dan
+    # hasil MCU-nya menyusul di tugas latar.
+    users = list(db.users.find({'_id': {'$in': ids}}, {'nama': 1}))
+    ids = [user['_id'] for user in users]
+    jumlah = db.users.delete_many({'_id': {'$in': ids}}).deleted_count if ids else 0
+    ubah_statistik('users', -jumlah)
+    for user in users:
+        invalidasi_identitas('user', user['nama'])
+    if not ids:
+        return jsonify({'result': 'success', 'dihapus': 0})
+    tugas = jalankan_tugas('hapus_data_user', ids)
+    return jsonify({'result': 'success', 'dihapus': jumlah, 'tugas': tugas}), 202
+
+
+@app.route('/api/admin/antrian/hapus', methods=['POST'])
+@admin_api
+def api_admin_hapus_antrian():
+    try:
+        ids = ids_hapus()
+    except ValueError as e:
+        return jsonify({'result': 'error', 'message': str(e)}), 400
+
+    dihapus = 0
+    for mcu in db.antrian.distinct('mcu', {'_id': {'$in': ids}}):
+        jumlah = db.antrian.delete_many({'_id': {'$in': ids}, 'mcu': mcu}).deleted_count
+        ubah_jumlah_antrian(mcu, -jumlah)
+        dihapus += jumlah
+    ubah_statistik('antrian', -dihapus)
+    # Arsip tidak tercatat di counter maupun jumlah per MCU
+    dihapus += db.antrian_arsip.delete_many({'_id': {'$in': ids}}).deleted_count
+    if dihapus:
+        invalidasi_halaman('antrian')
+        HUB_ANTRIAN.publish()
+    return jsonify({'result': 'success', 'dihapus': dihapus})
+
+
+@app.route('/api/admin/mcu/hapus', methods=['POST'])
+@admin_api
+def api_admin_hapus_mcu():
+    try:
+        ids = ids_hapus()
+    except ValueError as e:
+        return jsonify({'result': 'error', 'message': str(e)}), 400
+
+    dihapus = db.medical_checkup.delete_many({'_id': {'$in': ids}}).deleted_count
+    ubah_statistik('medical_checkup', -dihapus)
+    return jsonify({'result': 'success', 'dihapus': dihapus})
+
+
+# _________________ Server Produksi ________________________________________________
+
+
+def warmup_template():
+    # Semua template dikompilasi sekali per worker; dengan bytecode cache di disk
+    # worker berikutnya cukup memuat hasil kompilasi, bukan mem-parse ulang.
+    for nama in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(nama)
+
+
+def create_app():
+    muat_konfigurasi()
+    if app.jinja_env.bytecode_cache is None:
+        folder = os.environ.get('JINJA_CACHE_DIR', join(tempfile.gettempdir(), 'healtyme-jinja'))
+        os.makedirs(folder, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder)
+        warmup_template()
+    return app
+
+
+@app.route('/healthz')
+def healthz():
+    try:
+        db.command('ping')
+    except Exception as e:
+        return jsonify({'status': 'error', 'pid': os.getpid(), 'message': str(e)}), 503
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+@app.cli.command('serve')
+@click.option('--bind', default=lambda: os.environ.get('BIND', '0.0.0.0:5000'), show_default='0.0.0.0:5000')
+@click.option('--workers', type=int, default=lambda: int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1)), show_default='2 x CPU + 1')
+@click.option('--threads', type=int, default=lambda: int(os.environ.get('WEB_THREADS', 4)), show_default='4')
+@click.option('--worker-class', default=lambda: os.environ.get('WEB_WORKER_CLASS', 'gthread'), show_default='gthread', help="Stream /antrian/stream langsung butuh gthread (dibatasi setengah --threads per worker) atau worker async; dengan sync, klien hanya menerima snapshot tiap ANTRIAN_TICK detik.")
+@click.option('--timeout', type=int, default=30, show_default=True)
+@click.option('--graceful-timeout', type=int, default=30, show_default=True)
+@click.option('--max-requests', type=int, default=5000, show_default=True, help='Worker didaur ulang setelah sekian request (0 = tidak pernah).')
+def serve(bind, workers, threads, worker_class, timeout, graceful_timeout, max_requests):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('gunicorn belum terpasang (pip install -r requirements.txt)')
+
+    class ServerProduksi(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', worker_class)
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('graceful_timeout', graceful_timeout)
+            self.cfg.set('keepalive', 5)
+            self.cfg.set('max_requests', max_requests)
+            self.cfg.set('max_requests_jitter', max_requests // 10)
+            self.cfg.set('accesslog', '-')
+            self.cfg.set('child_exit', worker_berhenti)
+
+        def load(self):
+            return create_app()
+
+    def worker_berhenti(server, worker):
+        try:
+            lipat_metrik(konfigurasi['METRIK_DIR'], worker.pid)
+        except OSError as e:
+            server.log.warning('Metrik worker %s gagal dilipat: %s', worker.pid, e)
+
+    konfigurasi = muat_konfigurasi()
+    if konfigurasi['METRIK_DIR']:
+        for nama in os.listdir(konfigurasi['METRIK_DIR']):
+            if nama.startswith('metrik-'):
+                os.remove(join(konfigurasi['METRIK_DIR'], nama))
+    else:
+        # Folder bersama untuk counter semua worker, diwarisi lewat fork
+        konfigurasi['METRIK_DIR'] = tempfile.mkdtemp(prefix='healtyme-metrik-')
+
+    if worker_class in ('gthread', 'sync') and 'ANTRIAN_STREAM_MAKS' not in os.environ:
+        # Sisakan setengah thread untuk request biasa
+        konfigurasi['ANTRIAN_STREAM_MAKS'] = threads // 2 if worker_class == 'gthread' else 0
+    if worker_class == 'sync':
+        print('Peringatan: worker sync tidak bisa menahan stream; /antrian/stream hanya mengirim snapshot berkala')
+
+    # Index dibuat sekali di master; koneksinya tidak ikut terpakai oleh
+    # worker karena get_db() membuat client baru setelah fork.
+    ensure_indexes()
+    # Perintah MongoDB dari master tidak boleh ikut terwarisi ke setiap worker
+    with _metrik_lock:
+        for tabel in _metrik.values():
+            tabel.clear()
+    print(f'Melayani di {bind} dengan {workers} worker x {threads} thread (kill -HUP untuk restart worker, kill -TERM untuk berhenti)')
+    ServerProduksi().run()
 
 
 if __name__ == '__main__':
-    app.run('0.0.0.0', port=5000, debug=True)
+    ensure_indexes()
+    create_app().run('0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
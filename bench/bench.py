@@ -0,0 +1,315 @@
+"""Benchmark latency dan jumlah perintah MongoDB untuk alur user dan admin.
+
+Contoh:
+    python bench/bench.py --users 2000 --antrian 20000 --iterasi 200
+    python bench/bench.py --mongo-uri mongodb://localhost:27017 --output hasil.json
+
+Tanpa --mongo-uri dipakai mongomock (pip install -r requirements-dev.txt) sebagai pengganti
+MongoDB di dalam proses. Angka latency-nya tidak mewakili server sungguhan,
+tetapi jumlah perintah per route tetap bisa dibandingkan antar versi.
+Daftar antrian admin (/admin/detail/antrian) memakai $unionWith yang tidak
+ada di mongomock, jadi route itu hanya diukur dengan --mongo-uri.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from os.path import abspath, dirname, join
+from types import SimpleNamespace
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+SESI = ['Pagi', 'Siang', 'Sore']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', help='MongoDB sungguhan; tanpa ini dipakai mongomock')
+    parser.add_argument('--db', default='healtyme_bench', help='nama database (akan dikosongkan!)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--antrian', type=int, default=10000)
+    parser.add_argument('--mcu', type=int, default=10)
+    parser.add_argument('--hasil', type=int, default=5000)
+    parser.add_argument('--iterasi', type=int, default=100, help='jumlah perjalanan user (admin 1 per 5 user)')
+    parser.add_argument('--pekerja', type=int, default=1, help='thread klien paralel')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=f'bench-{datetime.now():%Y%m%d-%H%M%S}.json')
+    return parser.parse_args()
+
+
+def siapkan_app(args):
+    os.environ['MONGODB_URI'] = args.mongo_uri or 'mongodb://mongomock'
+    os.environ['DB_NAME'] = args.db
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['METRIK_DEBUG'] = '1'
+
+    if not args.mongo_uri:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import app as appmod
+    appmod.create_app()
+
+    if not args.mongo_uri:
+        pasang_penghitung_mongomock(appmod)
+    return appmod
+
+
+def pasang_penghitung_mongomock(appmod):
+    # mongomock tidak memanggil CommandListener, jadi event-nya dibuat di sini
+    # supaya Server-Timing dan /metrics tetap menghitung perintah per route.
+    import mongomock
+
+    nama_perintah = {
+        'find': 'find', 'find_one': 'find', 'aggregate': 'aggregate',
+        'count_documents': 'aggregate', 'estimated_document_count': 'count', 'distinct': 'distinct',
+        'insert_one': 'insert', 'insert_many': 'insert', 'update_one': 'update', 'update_many': 'update',
+        'bulk_write': 'update', 'delete_one': 'delete', 'delete_many': 'delete',
+        'find_one_and_update': 'findAndModify', 'find_one_and_delete': 'findAndModify',
+        'create_index': 'createIndexes',
+    }
+    kedalaman = threading.local()
+    nomor = iter(range(1, sys.maxsize))
+
+    def bungkus(metode, perintah):
+        def wrapper(self, *a, **kw):
+            if getattr(kedalaman, 'n', 0):
+                return metode(self, *a, **kw)
+            request_id = next(nomor)
+            appmod.PENDENGAR_MONGO.started(SimpleNamespace(
+                command_name=perintah, request_id=request_id,
+                command={perintah: self.name, 'filter': a[0] if a and isinstance(a[0], dict) else {}}))
+            kedalaman.n = 1
+            mulai = time.perf_counter()
+            try:
+                return metode(self, *a, **kw)
+            finally:
+                kedalaman.n = 0
+                appmod.PENDENGAR_MONGO.succeeded(SimpleNamespace(
+                    command_name=perintah, request_id=request_id,
+                    duration_micros=int((time.perf_counter() - mulai) * 1e6)))
+        return wrapper
+
+    for metode, perintah in nama_perintah.items():
+        setattr(mongomock.Collection, metode, bungkus(getattr(mongomock.Collection, metode), perintah))
+
+
+def nik(i):
+    return f'{i:016d}'
+
+
+def seed(appmod, args, rng):
+    db = appmod.db
+    for koleksi in ('users', 'admin', 'antrian', 'antrian_arsip', 'antrian_counter', 'antrian_jumlah', 'medical_checkup',
+                    'hasil_mcu', 'rollup_hasil_mcu', 'statistik', 'tugas'):
+        db[koleksi].drop()
+
+    db.admin.insert_one({'admin': 'bench', 'password': 'bench'})
+    users = [{
+        'nama': f'user{i}',
+        'nik': hashlib.sha256(nik(i).encode('utf-8')).hexdigest(),
+        'jenis_kelamin': rng.choice(['LAKI-LAKI', 'PEREMPUAN']),
+        'alamat': f'Jalan {i}',
+        'nama_normal': appmod.normal_nama(f'user{i}'),
+    } for i in range(args.users)]
+    user_ids = db.users.insert_many(users).inserted_ids
+
+    daftar_mcu = [f'MCU {i}' for i in range(args.mcu)]
+    db.medical_checkup.insert_many([
+        {'nama_mcu': nama, 'detailrs_mcu': f'RS {nama}', 'user_id': 'bench'} for nama in daftar_mcu
+    ])
+
+    # Data antrian mengikuti aturan pendaftaran: hanya hari kerja, satu
+    # pendaftaran per user per tanggal (index tanggal_user_unik), dan nomor
+    # urut per (tanggal, sesi, mcu) tidak melebihi kapasitas sesinya.
+    hari_ini = datetime.combine(datetime.now().date(), datetime.min.time())
+    daftar_tanggal = [tanggal for tanggal in (hari_ini + timedelta(days=hari) for hari in range(-180, 31)) if tanggal.weekday() < 5]
+    terdaftar, terisi, antrian = set(), {}, []
+    for _ in range(args.antrian * 20):
+        if len(antrian) >= args.antrian:
+            break
+        tanggal, sesi, mcu = rng.choice(daftar_tanggal), rng.choice(SESI), rng.choice(daftar_mcu)
+        user = rng.randrange(args.users)
+        jadwal = appmod.JADWAL_SESI[sesi.lower()]
+        if (user, tanggal) in terdaftar or terisi.get((tanggal, sesi, mcu), 0) >= jadwal['kapasitas']:
+            continue
+        terdaftar.add((user, tanggal))
+        nomor = terisi[(tanggal, sesi, mcu)] = terisi.get((tanggal, sesi, mcu), 0) + 1
+        antrian.append({
+            'user_id': user_ids[user], 'nama': f'user{user}', 'nomor_antrian': nomor,
+            'hari': appmod.HARI[tanggal.weekday()], 'jam': (jadwal['jam_awal'] + jadwal['durasi'] * (nomor - 1)).strftime('%H:%M'),
+            'tanggal': tanggal, 'sesi': sesi, 'mcu': mcu,
+        })
+    if len(antrian) < args.antrian:
+        raise SystemExit(f'Hanya {len(antrian)} antrian muat; tambah --users atau --mcu')
+    for awal in range(0, len(antrian), 5000):
+        db.antrian.insert_many(antrian[awal:awal + 5000])
+
+    hasil = []
+    for i in range(args.hasil):
+        user = rng.randrange(args.users)
+        doc, error = appmod.validasi_hasil_mcu({
+            'user_id': str(user_ids[user]), 'nama': f'user{user}', 'tanggal_lahir': '1990-01-01',
+            'umur': str(rng.randint(18, 70)), 'jenis_kelamin': 'LAKI-LAKI', 'alamat': 'x',
+            'tanggal_pemeriksaan': f'{hari_ini - timedelta(days=rng.randint(0, 720)):%Y-%m-%d}',
+            'berat_badan': str(rng.randint(45, 110)), 'tinggi_badan': str(rng.randint(150, 190)),
+            'tekanan_darah': f'{rng.randint(100, 160)}/{rng.randint(60, 100)}',
+            'kolesterol_total': str(rng.randint(120, 300)), 'kolesterol_hdl': str(rng.randint(30, 90)),
+            'kolesterol_ldl': str(rng.randint(60, 200)), 'gula_darah_puasa': str(rng.randint(70, 160)),
+            'gula_darah_sewaktu': str(rng.randint(80, 220)), 'gula_darah_sesudah_makan': str(rng.randint(90, 240)),
+            'warna_urine': 'Kuning', 'kejernihan_urine': 'Jernih', 'nitrit_urine': 'Negatif',
+            'protein_urine': 'Negatif', 'glukosa_urine': 'Negatif', 'mcu': rng.choice(daftar_mcu),
+        })
+        if error:
+            raise SystemExit(f'Data hasil_mcu bench tidak valid: {error}')
+        hasil.append(doc)
+    for awal in range(0, len(hasil), 5000):
+        db.hasil_mcu.insert_many(hasil[awal:awal + 5000])
+
+    gagal = appmod.ensure_indexes()
+    if gagal:
+        raise SystemExit(f'Index bench gagal dibuat: {gagal}')
+    appmod.hitung_ulang_statistik()
+    appmod.bangun_ulang_counter_antrian()
+    appmod.bangun_ulang_jumlah_antrian()
+    appmod.bangun_ulang_rollup()
+    return daftar_mcu
+
+
+class Pencatat:
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def kirim(self, client, label, method, url, **kw):
+        mulai = time.perf_counter()
+        response = client.open(url, method=method, **kw)
+        detik = time.perf_counter() - mulai
+        cocok = re.search(r'desc="(\d+) perintah"', response.headers.get('Server-Timing', ''))
+        with self._lock:
+            item = self.data.setdefault(label, {'detik': [], 'perintah': [], 'status': {}})
+            item['detik'].append(detik)
+            item['perintah'].append(int(cocok.group(1)) if cocok else 0)
+            item['status'][response.status_code] = item['status'].get(response.status_code, 0) + 1
+        return response
+
+
+def perjalanan_user(appmod, pencatat, rng, args, daftar_mcu):
+    client = appmod.app.test_client()
+    i = rng.randrange(args.users)
+    pencatat.kirim(client, 'POST /login', 'POST', '/login', data={'nama': f'user{i}', 'nik': nik(i)})
+    pencatat.kirim(client, 'GET /pendaftaranonline', 'GET', '/pendaftaranonline')
+    tanggal = datetime.now().date() + timedelta(days=rng.randint(1, 30))
+    while tanggal.weekday() >= 5:
+        tanggal += timedelta(days=1)
+    pencatat.kirim(client, 'POST /pendaftaranonline', 'POST', '/pendaftaranonline', data={
+        'nama': f'user{i}', 'tanggal': f'{tanggal:%Y-%m-%d}', 'sesi': rng.choice(SESI), 'mcu': rng.choice(daftar_mcu),
+    })
+    pencatat.kirim(client, 'GET /antrian', 'GET', '/antrian')
+    pencatat.kirim(client, 'GET /hasil_mcu', 'GET', '/hasil_mcu')
+
+
+def perjalanan_admin(appmod, pencatat, rng, args):
+    client = appmod.app.test_client()
+    pencatat.kirim(client, 'POST /admin/login', 'POST', '/admin/login', data={'nama': 'bench', 'pass': 'bench'})
+    pencatat.kirim(client, 'GET /admin', 'GET', '/admin')
+    if not args.mongo_uri:
+        # mongomock tidak mendukung $unionWith yang dipakai daftar antrian admin
+        return
+    pencatat.kirim(client, 'GET /admin/detail/antrian', 'GET', '/admin/detail/antrian')
+    halaman = rng.randint(2, max(args.antrian // 25, 2))
+    pencatat.kirim(client, 'GET /admin/detail/antrian?halaman=N', 'GET', f'/admin/detail/antrian?halaman={halaman}')
+
+
+def persentil(nilai, p):
+    urut = sorted(nilai)
+    return urut[min(len(urut) - 1, max(0, round(p / 100 * len(urut) + 0.5) - 1))]
+
+
+def ringkas(pencatat):
+    hasil = {}
+    for label, item in sorted(pencatat.data.items()):
+        detik = item['detik']
+        hasil[label] = {
+            'jumlah': len(detik),
+            'p50_ms': round(persentil(detik, 50) * 1000, 2),
+            'p95_ms': round(persentil(detik, 95) * 1000, 2),
+            'p99_ms': round(persentil(detik, 99) * 1000, 2),
+            'rata_ms': round(sum(detik) / len(detik) * 1000, 2),
+            'mongo_perintah_rata': round(sum(item['perintah']) / len(item['perintah']), 2),
+            'mongo_perintah_maks': max(item['perintah']),
+            'status': {str(k): v for k, v in item['status'].items()},
+        }
+    return hasil
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    appmod = siapkan_app(args)
+
+    mulai = time.perf_counter()
+    daftar_mcu = seed(appmod, args, rng)
+    print(f'Seed selesai dalam {time.perf_counter() - mulai:.1f} detik')
+
+    pencatat = Pencatat()
+    tugas = []
+    for n in range(args.iterasi):
+        tugas.append(('user', random.Random(args.seed + n)))
+        if n % 5 == 0:
+            tugas.append(('admin', random.Random(args.seed - n)))
+
+    def jalankan(item):
+        jenis, rng_tugas = item
+        if jenis == 'user':
+            perjalanan_user(appmod, pencatat, rng_tugas, args, daftar_mcu)
+        else:
+            perjalanan_admin(appmod, pencatat, rng_tugas, args)
+
+    mulai = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.pekerja) as executor:
+        list(executor.map(jalankan, tugas))
+    durasi = time.perf_counter() - mulai
+
+    routes = ringkas(pencatat)
+    total_request = sum(item['jumlah'] for item in routes.values())
+    laporan = {
+        'waktu': datetime.now().isoformat(timespec='seconds'),
+        'mongo': 'uri' if args.mongo_uri else 'mongomock',
+        'konfigurasi': {k: v for k, v in vars(args).items() if k not in ('mongo_uri', 'output')},
+        'total': {
+            'request': total_request,
+            'detik': round(durasi, 3),
+            'throughput_rps': round(total_request / durasi, 1),
+        },
+        'routes': routes,
+    }
+
+    print(f'{"route":<38} {"n":>5} {"p50":>8} {"p95":>8} {"p99":>8} {"mongo":>6}')
+    for label, item in routes.items():
+        print(f'{label:<38} {item["jumlah"]:>5} {item["p50_ms"]:>8} {item["p95_ms"]:>8} {item["p99_ms"]:>8} {item["mongo_perintah_rata"]:>6}')
+    print(f'{total_request} request dalam {durasi:.2f} detik ({laporan["total"]["throughput_rps"]} req/s)')
+
+    # Angka dari request yang gagal tidak berarti apa-apa, jadi bench dianggap gagal
+    gagal = {label: item['status'] for label, item in routes.items()
+             if any(not 200 <= int(status) < 300 for status in item['status'])}
+    laporan['gagal'] = gagal
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(laporan, f, indent=2)
+    print(f'Hasil disimpan ke {args.output}')
+    if gagal:
+        raise SystemExit(f'Ada respons non-2xx, hasil bench tidak valid: {gagal}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Bandingkan serialisasi JSON dan ukuran respons sebelum/sesudah provider BSON + kompresi.
+
+'sebelum' meniru cara lama: setiap nilai diubah manual lewat nilai_ekspor lalu
+di-encode dengan json bawaan. 'sesudah' memakai app.json (orjson bila terpasang)
+yang langsung meng-encode ObjectId/datetime.
+
+Contoh:
+    python bench/json_kompresi.py --dokumen 200 --output json.json
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from os.path import abspath, dirname, join
+
+from bson import ObjectId
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+
+def buat_dokumen(appmod, jumlah, rng):
+    docs = []
+    for _ in range(jumlah):
+        doc = {'_id': ObjectId(), 'user_id': str(ObjectId())}
+        for field in appmod.HASIL_MCU_FIELDS + appmod.HASIL_MCU_TURUNAN:
+            doc[field] = rng.randint(50, 250) if field in appmod.HASIL_MCU_ANGKA else f'nilai {field}'
+        doc['tanggal_pemeriksaan'] = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 365))
+        doc['tanggal_lahir'] = datetime(1980, 1, 1) + timedelta(days=rng.randint(0, 9000))
+        docs.append(doc)
+    return docs
+
+
+def ukuran(data, brotli):
+    hasil = {'mentah': len(data), 'gzip': len(gzip.compress(data, compresslevel=6))}
+    if brotli is not None:
+        hasil['br'] = len(brotli.compress(data, quality=4))
+    return hasil
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dokumen', type=int, default=200, help='jumlah dokumen hasil_mcu per respons')
+    parser.add_argument('--ulang', type=int, default=200)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', 'healtyme_bench')
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    import app as appmod
+    app = appmod.create_app()
+
+    docs = buat_dokumen(appmod, args.dokumen, random.Random(42))
+
+    def sebelum():
+        data = [{field: appmod.nilai_ekspor(nilai) for field, nilai in doc.items()} for doc in docs]
+        return json.dumps({'result': 'success', 'data': data}, separators=(',', ':'), sort_keys=True)
+
+    def sesudah():
+        return app.json.dumps({'result': 'success', 'data': docs}, separators=(',', ':'))
+
+    with app.app_context():
+        ms_sebelum = min(timeit.repeat(sebelum, number=args.ulang, repeat=3)) / args.ulang * 1000
+        ms_sesudah = min(timeit.repeat(sesudah, number=args.ulang, repeat=3)) / args.ulang * 1000
+        body_json = sesudah().encode()
+
+    client = app.test_client()
+    halaman = {}
+    for url in ('/', '/petunjuk', '/artikelkolesterol'):
+        halaman[url] = {
+            'tanpa_kompresi': len(client.get(url).data),
+            'gzip': len(client.get(url, headers={'Accept-Encoding': 'gzip'}).data),
+        }
+        if appmod.brotli is not None:
+            halaman[url]['br'] = len(client.get(url, headers={'Accept-Encoding': 'br'}).data)
+
+    laporan = {
+        'waktu': datetime.now().isoformat(timespec='seconds'),
+        'orjson': appmod.orjson is not None,
+        'brotli': appmod.brotli is not None,
+        'dokumen': args.dokumen,
+        'serialisasi_ms': {'sebelum': round(ms_sebelum, 3), 'sesudah': round(ms_sesudah, 3)},
+        'json_bytes': ukuran(body_json, appmod.brotli),
+        'halaman_bytes': halaman,
+    }
+
+    print(f'Serialisasi {args.dokumen} dokumen: {ms_sebelum:.2f} ms -> {ms_sesudah:.2f} ms '
+          f'({"orjson" if laporan["orjson"] else "json bawaan"})')
+    print(f'JSON: {laporan["json_bytes"]}')
+    for url, item in halaman.items():
+        print(f'{url}: {item}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(laporan, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
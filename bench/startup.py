@@ -0,0 +1,63 @@
+"""Ukur waktu import app.py dan create_app() per proses worker.
+
+Setiap putaran memakai proses Python baru, sama seperti worker gunicorn yang
+baru di-fork/di-spawn. Putaran pertama memakai folder bytecode cache Jinja yang
+kosong (cold start), sisanya memakai cache yang sudah terisi.
+
+Contoh:
+    python bench/startup.py --putaran 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from os.path import abspath, dirname, join
+
+ROOT = join(dirname(abspath(__file__)), '..')
+
+SKRIP = '''
+import json, time
+mulai = time.perf_counter()
+import app
+setelah_import = time.perf_counter()
+app.create_app()
+selesai = time.perf_counter()
+print(json.dumps({'import_ms': (setelah_import - mulai) * 1000, 'create_app_ms': (selesai - setelah_import) * 1000}))
+'''
+
+
+def satu_putaran(cache_dir):
+    env = dict(os.environ, JINJA_CACHE_DIR=cache_dir)
+    env.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+    env.setdefault('DB_NAME', 'healtyme_bench')
+    hasil = subprocess.run([sys.executable, '-c', SKRIP], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(hasil.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--putaran', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold = satu_putaran(cache_dir)
+        warm = [satu_putaran(cache_dir) for _ in range(args.putaran)]
+
+    laporan = {
+        'cold': {k: round(v, 1) for k, v in cold.items()},
+        'warm_median': {k: round(statistics.median(p[k] for p in warm), 1) for k in cold},
+        'putaran': args.putaran,
+    }
+    print(f'cold : import {laporan["cold"]["import_ms"]} ms, create_app {laporan["cold"]["create_app_ms"]} ms')
+    print(f'warm : import {laporan["warm_median"]["import_ms"]} ms, create_app {laporan["warm_median"]["create_app_ms"]} ms (median {args.putaran} putaran)')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(laporan, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
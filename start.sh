@@ -14,5 +14,5 @@ fi
 
 $VIRTUALENV/bin/pip install -r requirements.txt
 
-$VIRTUALENV/bin/python3 app.py
+$VIRTUALENV/bin/flask --app app serve
 Footer
\ No newline at end of file
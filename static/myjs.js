@@ -314,6 +314,40 @@ function saveData() {
     });
 }
 
+function barisTabel(nilai) {
+    let baris = $('<tr>');
+    nilai.forEach(function (isi) {
+        baris.append($('<td>').text(isi === undefined || isi === null ? '' : isi));
+    });
+    return baris;
+}
+
+function muatHalaman(url, tabel, tombol, buatBaris) {
+    // Data diambil per halaman lewat token 'lanjut' dari server
+    let lanjut = null;
+
+    function muat() {
+        $.ajax({
+            url: url,
+            method: 'GET',
+            data: lanjut ? { lanjut: lanjut } : {},
+            success: function (response) {
+                response.data.forEach(function (item) {
+                    $(tabel).append(buatBaris(item));
+                });
+                lanjut = response.lanjut;
+                $(tombol).toggle(lanjut !== null);
+            },
+            error: function (error) {
+                console.log('Error:', error);
+            }
+        });
+    }
+
+    $(tombol).on('click', muat);
+    muat();
+}
+
 function tambahData() {
     // Gantilah dengan logika untuk menambah data atau alur yang sesuai
     // Contoh: redirect ke halaman tambah data
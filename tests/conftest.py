@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import uuid
+from os.path import abspath, dirname, join
+
+import pytest
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+os.environ.setdefault('SECRET_KEY', 'rahasia-test')
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'healtyme_test')
+# Pemulihan berkala berjalan di thread latar dan bisa menyentuh database test lain
+os.environ.setdefault('TUGAS_PULIH_INTERVAL', '0')
+
+import app as appmod  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'mongodb: butuh MongoDB sungguhan lewat MONGODB_TEST_URI')
+    # Tanpa database sama sekali semua tes akan ter-skip dan CI tetap hijau,
+    # jadi dependensi yang hilang menghentikan test run.
+    if not os.environ.get('MONGODB_TEST_URI'):
+        try:
+            import mongomock  # noqa: F401
+        except ImportError:
+            raise pytest.UsageError('mongomock belum terpasang: pip install -r requirements-dev.txt, atau set MONGODB_TEST_URI')
+
+
+def pytest_collection_modifyitems(config, items):
+    # mongomock tidak mendukung semua tahap aggregate (mis. $unionWith)
+    if os.environ.get('MONGODB_TEST_URI'):
+        return
+    lewati = pytest.mark.skip(reason='butuh MongoDB sungguhan, set MONGODB_TEST_URI')
+    for item in items:
+        if 'mongodb' in item.keywords:
+            item.add_marker(lewati)
+
+
+def buat_client_mongo():
+    # MONGODB_TEST_URI menunjuk MongoDB sungguhan; tanpa itu dipakai mongomock
+    uri = os.environ.get('MONGODB_TEST_URI')
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri, serverSelectionTimeoutMS=2000)
+    import mongomock
+    atomikkan_mongomock(mongomock)
+    return mongomock.MongoClient()
+
+
+def atomikkan_mongomock(mongomock):
+    # MongoDB mengubah satu dokumen secara atomik, sedangkan mongomock menjalankan
+    # find_one_and_update sebagai find lalu update terpisah. Tanpa kunci ini tes
+    # konkurensi gagal karena mock-nya, bukan karena kode aplikasi.
+    if getattr(mongomock.Collection, '_atomik', False):
+        return
+    kunci = threading.RLock()
+    for nama in ('_insert', '_update', '_find_and_modify', '_delete'):
+        def bungkus(*args, _asli=getattr(mongomock.Collection, nama), **kwargs):
+            with kunci:
+                return _asli(*args, **kwargs)
+        setattr(mongomock.Collection, nama, bungkus)
+    mongomock.Collection._atomik = True
+
+
+@pytest.fixture
+def app():
+    client = buat_client_mongo()
+    nama_db = f'healtyme_test_{uuid.uuid4().hex[:8]}'
+    appmod._mongo.update(pid=os.getpid(), client=client, db=client[nama_db])
+    konfigurasi = dict(appmod.muat_konfigurasi())
+    appmod.ensure_indexes()
+    for cache in (appmod.RENDER_CACHE, appmod.TOKEN_CACHE, appmod.IDENTITAS_CACHE, appmod.SLOT_CACHE):
+        cache.clear()
+    appmod.HUB_ANTRIAN.terakhir = None
+    appmod.HUB_ANTRIAN.tersimpan = (0, None)
+    yield appmod
+    appmod.app.config.update(konfigurasi)
+    with appmod.HUB_ANTRIAN._lock:
+        appmod.HUB_ANTRIAN.pelanggan.clear()
+    client.drop_database(nama_db)
+    appmod._mongo.update(pid=None, client=None, db=None)
+
+
+@pytest.fixture
+def hari_kerja(app):
+    # Tanggal hari kerja mulai besok, dalam format form pendaftaran
+    def ambil(jumlah=1):
+        return [tanggal.strftime('%Y-%m-%d') for tanggal in app.hari_kerja_berikutnya(jumlah)]
+    return ambil
+
+
+@pytest.fixture
+def admin_client(app):
+    app.db.admin.insert_one({'admin': 'admin', 'password': 'rahasia'})
+    client = app.app.test_client()
+    client.post('/admin/login', data={'nama': 'admin', 'pass': 'rahasia'})
+    return client
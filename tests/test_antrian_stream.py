@@ -0,0 +1,95 @@
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from werkzeug.serving import BaseWSGIServer
+
+THREADS = 4
+
+
+class ServerThreadTerbatas(BaseWSGIServer):
+    # Meniru worker gunicorn gthread: request dilayani pool berisi THREADS thread
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=THREADS)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.proses, request, client_address)
+
+    def proses(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+@pytest.fixture
+def server(app):
+    app.muat_konfigurasi().update(ANTRIAN_STREAM_MAKS=THREADS // 2, ANTRIAN_STREAM_DETIK=2)
+    server = ServerThreadTerbatas('127.0.0.1', 0, app.app)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def buka_stream(port):
+    koneksi = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    koneksi.request('GET', '/antrian/stream')
+    response = koneksi.getresponse()
+    return koneksi, response, response.fp.readline()
+
+
+def test_stream_tidak_menghabiskan_thread_worker(app, server):
+    app.db.antrian_jumlah.insert_one({'_id': 'Paket A', 'total': 3})
+    port = server.server_port
+    stream = [buka_stream(port) for _ in range(THREADS + 2)]
+    try:
+        assert all(response.status == 200 for _, response, _ in stream)
+        assert len(app.HUB_ANTRIAN.pelanggan) == THREADS // 2
+
+        # Stream di atas batas langsung ditutup setelah satu snapshot
+        _, response, _ = stream[-1]
+        sisa = response.read().decode()
+        assert 'event: antrian' in sisa and 'Paket A' in sisa
+
+        koneksi = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        koneksi.request('GET', '/healthz')
+        assert koneksi.getresponse().status == 200
+        koneksi.close()
+    finally:
+        for koneksi, _, _ in stream:
+            koneksi.close()
+
+
+def test_stream_ditutup_setelah_umur_maksimal(app):
+    app.muat_konfigurasi()['ANTRIAN_STREAM_DETIK'] = 0
+    response = app.app.test_client().get('/antrian/stream')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'retry: 5000\n\n'
+    assert not app.HUB_ANTRIAN.pelanggan
+
+
+def test_klien_di_luar_batas_berbagi_snapshot_tersimpan(app, monkeypatch):
+    app.muat_konfigurasi().update(ANTRIAN_STREAM_MAKS=0, ANTRIAN_TICK=60)
+    asli = app.HUB_ANTRIAN.snapshot
+    dihitung = []
+    monkeypatch.setattr(app.HUB_ANTRIAN, 'snapshot', lambda: dihitung.append(1) or asli())
+    client = app.app.test_client()
+
+    for _ in range(5):
+        teks = client.get('/antrian/stream').get_data(as_text=True)
+        assert teks.startswith('retry: 60000') and 'event: antrian' in teks
+    assert len(dihitung) == 1
+
+    # Perubahan membuat snapshot basi, tetapi tetap dihitung paling sering sekali per ANTRIAN_JEDA_MIN
+    app.HUB_ANTRIAN.publish()
+    client.get('/antrian/stream')
+    assert len(dihitung) == 1
+    monkeypatch.setattr(app, 'ANTRIAN_JEDA_MIN', 0)
+    client.get('/antrian/stream')
+    client.get('/antrian/stream')
+    assert len(dihitung) == 2
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def isi_antrian(app):
+    hari_ini = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    app.db.antrian.insert_many([
+        {'tanggal': hari_ini + timedelta(days=hari), 'sesi': 'Pagi', 'mcu': mcu, 'nomor_antrian': nomor}
+        for hari in range(-6, 4) for mcu in ('Paket A', 'Paket B') for nomor in (1, 2)
+    ])
+    app.bangun_ulang_jumlah_antrian()
+    app.hitung_ulang_statistik()
+    return hari_ini
+
+
+def test_statistik_tetap_benar_setelah_arsip_kedaluwarsa(app):
+    hari_ini = isi_antrian(app)
+    assert app.arsipkan_antrian(hari_ini, batch=7) == 24
+    assert app.get_statistik()['antrian'] == 40
+
+    # Index TTL menghapus arsip tanpa lewat aplikasi
+    app.db.antrian_arsip.delete_many({'tanggal': {'$lt': hari_ini - timedelta(days=3)}})
+    assert app.get_statistik()['antrian'] == app.db.antrian.count_documents({}) + app.db.antrian_arsip.count_documents({})
+
+
+def test_statistik_versi_lama_dihitung_ulang(app):
+    isi_antrian(app)
+    app.db.statistik.replace_one({'_id': 'dashboard'}, {'users': 0, 'antrian': 999, 'medical_checkup': 0, 'hasil_mcu': 0})
+    assert app.get_statistik()['antrian'] == 40
+
+
+@pytest.mark.mongodb
+def test_daftar_antrian_admin_menggabungkan_arsip_sesuai_urutan(app):
+    hari_ini = isi_antrian(app)
+    app.arsipkan_antrian(hari_ini)
+    with app.app.test_request_context():
+        semua = app.cari_antrian_admin({}, 0, 100)
+        halaman = app.cari_antrian_admin({}, 22, 5)
+    kunci = [(doc['tanggal'], doc['sesi'], doc['mcu'], doc['nomor_antrian']) for doc in semua]
+    assert len(kunci) == 40 and kunci == sorted(kunci)
+    assert [doc['_id'] for doc in halaman] == [doc['_id'] for doc in semua[22:27]]
+
+
+@pytest.mark.mongodb
+def test_halaman_detail_antrian_admin(app, admin_client):
+    hari_ini = isi_antrian(app)
+    app.arsipkan_antrian(hari_ini)
+    assert admin_client.get('/admin/detail/antrian?halaman=2').status_code == 200
+
+    # Halaman di luar jangkauan dipotong ke halaman terakhir
+    response = admin_client.get('/admin/detail/antrian?halaman=1000000')
+    assert response.status_code == 200
+    assert 'Halaman 2 dari 2' in response.get_data(as_text=True)
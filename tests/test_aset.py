@@ -0,0 +1,37 @@
+import json
+import os
+
+
+def siapkan_static(app, monkeypatch, tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    monkeypatch.setattr(app, 'STATIC_DIR', str(static))
+    monkeypatch.setattr(app, 'DIST_DIR', str(static / 'dist'))
+    app.muat_manifest.cache_clear()
+    return static
+
+
+def test_build_ulang_tidak_menghapus_file_hash_lama(app, monkeypatch, tmp_path):
+    static = siapkan_static(app, monkeypatch, tmp_path)
+    (static / 'css' / 'gaya.css').write_text('body { color: red; }' * 100)
+    lama = app.build_aset()[0]['css/gaya.css']['file']
+    with app.app.test_request_context():
+        assert app.aset('css/gaya.css') == f'/aset/{lama}'
+
+    (static / 'css' / 'gaya.css').write_text('body { color: blue; }' * 100)
+    baru = app.build_aset()[0]['css/gaya.css']['file']
+    assert baru != lama
+
+    client = app.app.test_client()
+    assert client.get(f'/aset/{lama}').status_code == 200
+    assert client.get(f'/aset/{baru}').status_code == 200
+    manifest = json.loads((static / 'dist' / 'manifest.json').read_text())
+    assert manifest['css/gaya.css']['file'] == baru
+
+    assert app.bersihkan_aset(60 * 60) == 0
+    varian = ['', '.gz'] + (['.br'] if app.brotli else [])
+    assert app.bersihkan_aset(0) == len(varian)
+    assert client.get(f'/aset/{lama}').status_code == 404
+    nama_baru = baru.split('/')[-1]
+    assert sorted(os.listdir(static / 'dist' / 'css')) == sorted(nama_baru + akhiran for akhiran in varian)
+    app.muat_manifest.cache_clear()
@@ -0,0 +1,25 @@
+import gzip
+
+
+def test_cache_hit_tidak_mengompres_ulang(app, monkeypatch):
+    dikompres = []
+    asli = app.kompres
+    monkeypatch.setattr(app, 'kompres', lambda data, encoding: dikompres.append(encoding) or asli(data, encoding))
+    client = app.app.test_client()
+
+    pertama = client.get('/artikelkolesterol', headers={'Accept-Encoding': 'gzip'})
+    kedua = client.get('/artikelkolesterol', headers={'Accept-Encoding': 'gzip'})
+    assert dikompres == ['gzip']
+    assert kedua.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in kedua.headers['Vary']
+    assert kedua.get_data() == pertama.get_data()
+
+    etag, lemah = kedua.get_etag()
+    assert etag.endswith('-gzip') and not lemah
+    assert client.get('/artikelkolesterol', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    # Representasi tanpa kompresi punya ETag kuat sendiri
+    polos = client.get('/artikelkolesterol', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in polos.headers
+    assert polos.get_etag() == (etag[:-len('-gzip')], False)
+    assert gzip.decompress(kedua.get_data()) == polos.get_data()
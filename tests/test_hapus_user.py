@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def tunggu_tugas(client, _id):
+    for _ in range(100):
+        tugas = client.get(f'/api/admin/tugas/{_id}').get_json()['data']
+        if tugas['status'] in ('selesai', 'gagal'):
+            return tugas
+        time.sleep(0.02)
+    raise AssertionError(f'tugas {_id} tidak selesai')
+
+
+def buat_user(app, nama, kolesterol):
+    _id = app.db.users.insert_one({'nama': nama, 'nik': nama}).inserted_id
+    besok = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    app.db.antrian.insert_one({'user_id': _id, 'tanggal': besok, 'mcu': 'Paket A', 'sesi': 'Pagi', 'nomor_antrian': 1})
+    hasil = [{'user_id': str(_id), 'mcu': 'Paket A', 'tanggal_pemeriksaan': datetime(2024, 1, 10), 'kolesterol_total': nilai} for nilai in kolesterol]
+    app.db.hasil_mcu.insert_many(hasil)
+    app.perbarui_rollup(hasil)
+    app.ubah_jumlah_antrian('Paket A', 1)
+    return _id
+
+
+def test_delete_user_butuh_admin(app):
+    _id = buat_user(app, 'budi', [180])
+    response = app.app.test_client().post('/delete_user', json={'_id': str(_id)})
+    assert response.status_code == 401
+    assert app.db.users.count_documents({}) == 1
+
+
+def test_hapus_user_membersihkan_antrian_dan_hasil_mcu(app, admin_client):
+    budi = buat_user(app, 'budi', [150, 260])
+    buat_user(app, 'siti', [170, 190])
+    app.hitung_ulang_statistik()
+
+    response = admin_client.post('/delete_user', json={'_id': str(budi)})
+    tugas = tunggu_tugas(admin_client, response.get_json()['tugas'])
+
+    assert tugas['status'] == 'selesai'
+    assert tugas['hasil'] == {'antrian': 1, 'antrian_arsip': 0, 'hasil_mcu': 2}
+    assert app.db.antrian.count_documents({'user_id': budi}) == 0
+    assert app.db.hasil_mcu.count_documents({'user_id': str(budi)}) == 0
+    assert app.hitung_antrian_per_mcu() == [{'_id': 'Paket A', 'totalPendaftar': 1}]
+    rollup = app.ringkas_rollup(app.db.rollup_hasil_mcu.find_one({'_id': 'Paket A|2024-01'}))
+    assert rollup['jumlah'] == 2
+    assert rollup['metrik']['kolesterol_total']['min'] == 170
+    assert rollup['metrik']['kolesterol_total']['max'] == 190
+    statistik = app.get_statistik()
+    assert (statistik['users'], statistik['antrian'], statistik['hasil_mcu']) == (1, 1, 2)
+
+
+def test_tugas_yang_terhenti_dipulihkan_tanpa_menghitung_dua_kali(app, admin_client):
+    budi = buat_user(app, 'budi', [150])
+    app.db.users.delete_one({'_id': budi})
+    lama = datetime.utcnow() - timedelta(hours=1)
+    app.db.tugas.insert_one({
+        '_id': 'terhenti', 'jenis': 'hapus_data_user', 'args': [[budi]], 'status': 'berjalan',
+        'percobaan': 1, 'dibuat_pada': lama, 'diperbarui_pada': lama,
+    })
+
+    assert app.pulihkan_tugas() == ['terhenti']
+    assert tunggu_tugas(admin_client, 'terhenti')['hasil']['hasil_mcu'] == 1
+
+    # Diulang sekali lagi: tidak ada yang terhapus, ringkasan tidak berubah
+    app.hapus_data_user([budi])
+    assert app.hitung_antrian_per_mcu() == []
+    assert app.db.rollup_hasil_mcu.count_documents({}) == 0
+
+
+def test_hapus_data_user_per_batch_mengurangi_ringkasan_dengan_tepat(app, monkeypatch):
+    monkeypatch.setattr(app, 'IMPOR_BATCH', 2)
+    budi = buat_user(app, 'budi', [150, 260, 210])
+    siti = buat_user(app, 'siti', [170])
+    lain_bulan = [{'user_id': str(budi), 'mcu': 'Paket B', 'tanggal_pemeriksaan': datetime(2024, 2, 1), 'kolesterol_total': nilai}
+                  for nilai in (120, 300)]
+    app.db.hasil_mcu.insert_many(lain_bulan)
+    app.perbarui_rollup(lain_bulan)
+    app.hitung_ulang_statistik()
+
+    assert app.hapus_data_user([budi]) == {'antrian': 1, 'antrian_arsip': 0, 'hasil_mcu': 5}
+    assert app.db.rollup_hasil_mcu.find_one({'_id': 'Paket B|2024-02'}) is None
+    rollup = app.ringkas_rollup(app.db.rollup_hasil_mcu.find_one({'_id': 'Paket A|2024-01'}))
+    assert (rollup['jumlah'], rollup['metrik']['kolesterol_total']['max']) == (1, 170)
+    statistik = app.get_statistik()
+    assert (statistik['antrian'], statistik['hasil_mcu']) == (1, 1)
+    assert app.db.antrian.count_documents({'user_id': siti}) == 1
+
+
+def test_bucket_rollup_dihitung_ulang_dari_hasil_mcu(app):
+    buat_user(app, 'budi', [150, 260])
+    app.db.hasil_mcu.delete_one({'kolesterol_total': 260})
+
+    # Penghapus lain mendahului: bucket dibangun ulang dari dokumen yang tersisa
+    app.hitung_ulang_rollup_bucket('Paket A', '2024-01')
+    rollup = app.ringkas_rollup(app.db.rollup_hasil_mcu.find_one({'_id': 'Paket A|2024-01'}))
+    assert (rollup['jumlah'], rollup['metrik']['kolesterol_total']['max']) == (1, 150)
+
+
+def test_pemulihan_tugas_menunggu_request_pertama(app, monkeypatch):
+    dipanggil = threading.Event()
+    monkeypatch.setattr(app, 'pulihkan_tugas', dipanggil.set)
+    monkeypatch.setitem(app._tugas, 'pemulihan', None)
+    app.app.config['TUGAS_PULIH_INTERVAL'] = 3600
+
+    app.create_app()
+    assert not dipanggil.is_set()
+    app.app.test_client().get('/healthz')
+    assert dipanggil.wait(2)
+
+
+def test_user_terhapus_di_worker_lain_tidak_bisa_mendaftar(app, hari_kerja):
+    app.db.users.insert_one({'nama': 'budi', 'nik': app.hashlib.sha256(b'123').hexdigest()})
+    client = app.app.test_client()
+    client.post('/login', data={'nama': 'budi', 'nik': '123'})
+    assert client.get('/api/hasil_mcu/terbaru').status_code == 200
+
+    # Worker lain menghapus user: cache identitas di worker ini tidak ikut dibersihkan
+    app.db.users.delete_one({'nama': 'budi'})
+    assert app.IDENTITAS_CACHE.get(('user', 'budi')) is not None
+
+    response = client.post('/pendaftaranonline', data={
+        'nama': 'budi', 'tanggal': hari_kerja()[0], 'sesi': 'Pagi', 'mcu': 'Paket A',
+    })
+    assert response.status_code == 401
+    assert app.db.antrian.count_documents({}) == 0
@@ -0,0 +1,73 @@
+import pytest
+
+FORM_HASIL = {
+    'nama': 'Budi', 'tanggal_lahir': '1990-01-01', 'umur': '34', 'jenis_kelamin': 'L', 'alamat': 'Bandung',
+    'tanggal_pemeriksaan': '2024-03-05', 'berat_badan': '70', 'tinggi_badan': '170', 'tekanan_darah': '120/80',
+    'kolesterol_total': '180', 'kolesterol_hdl': '50', 'kolesterol_ldl': '110', 'gula_darah_puasa': '90',
+    'gula_darah_sewaktu': '110', 'gula_darah_sesudah_makan': '130', 'warna_urine': 'kuning',
+    'kejernihan_urine': 'jernih', 'nitrit_urine': 'negatif', 'protein_urine': 'negatif', 'glukosa_urine': 'negatif',
+}
+
+
+@pytest.mark.parametrize('nilai', ['nan', 'inf', '-inf', '1e999'])
+def test_nilai_tak_hingga_ditolak(app, admin_client, nilai):
+    user_id = app.db.users.insert_one({'nama': 'Budi'}).inserted_id
+    response = admin_client.post('/save_hasil_mcu', data=dict(FORM_HASIL, user_id=str(user_id), kolesterol_total=nilai))
+    assert response.status_code == 200
+    assert response.get_json()['success'] is False
+    assert app.db.hasil_mcu.count_documents({}) == 0
+
+
+def test_hasil_mcu_tersimpan_dan_masuk_rollup(app, admin_client):
+    user_id = app.db.users.insert_one({'nama': 'Budi'}).inserted_id
+    response = admin_client.post('/save_hasil_mcu', data=dict(FORM_HASIL, user_id=str(user_id), mcu='Paket A'))
+    assert response.get_json()['success'] is True
+    assert app.db.rollup_hasil_mcu.find_one({'_id': 'Paket A|2024-03'})['jumlah'] == 1
+
+
+def test_migrasi_melaporkan_dokumen_lama_yang_tidak_lengkap(app):
+    lengkap = dict(FORM_HASIL, user_id='x')
+    rusak = dict(FORM_HASIL, user_id='y')
+    del rusak['kolesterol_total']
+    app.db.hasil_mcu.insert_many([lengkap, rusak])
+
+    result = app.app.test_cli_runner().invoke(args=['migrasi-hasil-mcu'])
+    assert result.exit_code == 0, result.output
+    assert '1 hasil MCU dimigrasi' in result.output
+    assert f"Gagal: {rusak['_id']} Nilai kolesterol_total harus berupa angka" in result.output
+
+
+def test_impor_array_json_dibaca_per_elemen(app, monkeypatch):
+    import io
+    import json
+
+    # Potongan kecil memaksa elemen terbelah di antara dua pembacaan
+    monkeypatch.setattr(app, 'IMPOR_POTONGAN', 7)
+    data = [{'nama': 'Budi', 'umur': 12345}, {'nama': 'Siti, "A"', 'nilai': [1, 2.5]}, {}]
+    berkas = io.BytesIO((' \n' + json.dumps(data, indent=1)).encode())
+    assert list(app.baca_baris_impor(berkas, 'hasil.json')) == data
+    assert list(app.baca_baris_impor(io.BytesIO(b'[ ]'), 'hasil.json')) == []
+
+
+@pytest.mark.parametrize('isi', [b'[{"a": 1}', b'[{"a": 1},]', b'[{"a": 1} {"b": 2}]', b'[{"a": }]'])
+def test_impor_array_json_rusak_ditolak(app, isi):
+    import io
+
+    with pytest.raises(ValueError):
+        list(app.baca_baris_impor(io.BytesIO(isi), 'hasil.json'))
+
+
+def test_impor_menolak_user_yang_tidak_ada(app, admin_client):
+    import io
+    import json
+
+    user_id = str(app.db.users.insert_one({'nama': 'Budi'}).inserted_id)
+    baris = [dict(FORM_HASIL, user_id=user_id), dict(FORM_HASIL, user_id='0' * 24), dict(FORM_HASIL, user_id='bukan-id')]
+    berkas = io.BytesIO('\n'.join(json.dumps(data) for data in baris).encode())
+    response = admin_client.post('/admin/hasil/impor', data={'berkas': (berkas, 'hasil.ndjson')})
+
+    laporan = response.get_json()
+    assert (laporan['diproses'], laporan['disimpan']) == (3, 1)
+    assert sorted(gagal['baris'] for gagal in laporan['gagal']) == [2, 3]
+    assert all(gagal['message'] == 'User tidak ditemukan' for gagal in laporan['gagal'])
+    assert [doc['user_id'] for doc in app.db.hasil_mcu.find()] == [user_id]
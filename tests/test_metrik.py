@@ -0,0 +1,53 @@
+import json
+import os
+
+
+def test_metrics_tertutup_tanpa_token(app):
+    client = app.app.test_client()
+    assert client.get('/metrics').status_code == 401
+
+    app.muat_konfigurasi()['METRIK_TOKEN'] = 'rahasia'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer rahasia'}).status_code == 200
+
+
+def test_metrics_menjumlahkan_semua_worker(app, tmp_path):
+    konfigurasi = app.muat_konfigurasi()
+    konfigurasi.update(METRIK_DIR=str(tmp_path), METRIK_TOKEN='rahasia')
+    with app._metrik_lock:
+        for tabel in app._metrik.values():
+            tabel.clear()
+    client = app.app.test_client()
+    client.get('/healthz')
+
+    # Berkas dari worker lain dengan route yang sama
+    lain = {jenis: [] for jenis in app._metrik}
+    lain['status'] = [[['healthz', 'GET', 200], 4]]
+    (tmp_path / 'metrik-1-abcd1234.json').write_text(json.dumps(lain))
+
+    teks = client.get('/metrics', headers={'Authorization': 'Bearer rahasia'}).get_data(as_text=True)
+    assert 'http_requests_total{route="healthz",method="GET",status="200"} 5' in teks
+    assert len([nama for nama in os.listdir(tmp_path) if nama.startswith('metrik-')]) == 2
+
+
+def test_metrik_worker_mati_dilipat_ke_satu_berkas(app, tmp_path):
+    app.muat_konfigurasi()['METRIK_DIR'] = str(tmp_path)
+
+    def berkas(nama, jumlah):
+        data = {'status': [[['bench', 'GET', 200], jumlah]]}
+        (tmp_path / nama).write_text(json.dumps(data))
+
+    berkas('metrik-11-aaaa0000.json', 1)
+    berkas('metrik-11-bbbb0000.json', 2)
+    berkas('metrik-12-cccc0000.json', 4)
+    app.lipat_metrik(str(tmp_path), 11)
+    berkas('metrik-13-dddd0000.json', 8)
+    app.lipat_metrik(str(tmp_path), 13)
+
+    sisa = sorted(nama for nama in os.listdir(tmp_path) if nama.startswith('metrik-'))
+    assert sisa == ['metrik-12-cccc0000.json', 'metrik-mati.json']
+    assert app.kumpulkan_metrik()['status'][('bench', 'GET', 200)] == 15
+
+    # Berkas yang tercatat terlipat tetapi belum terhapus tidak dihitung dua kali
+    berkas('metrik-13-dddd0000.json', 8)
+    assert app.kumpulkan_metrik()['status'][('bench', 'GET', 200)] == 15
@@ -0,0 +1,67 @@
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+JUMLAH_USER = 300
+
+
+def login(app, nama):
+    nik = f'{abs(hash(nama)):016d}'[:16]
+    app.db.users.insert_one({'nama': nama, 'nik': hashlib.sha256(nik.encode()).hexdigest()})
+    client = app.app.test_client()
+    assert client.post('/login', data={'nama': nama, 'nik': nik}).get_json()['result'] == 'success'
+    return client
+
+
+def daftar(client, nama, tanggal, sesi='Sore', mcu='Paket A'):
+    return client.post('/pendaftaranonline', data={'nama': nama, 'tanggal': tanggal, 'sesi': sesi, 'mcu': mcu}).get_json()
+
+
+def test_pendaftaran_paralel_mendapat_nomor_unik_tanpa_celah(app, hari_kerja):
+    # Ratusan user tersebar di beberapa (tanggal, sesi, mcu), dan setiap user
+    # mengirim dua kali bersamaan: nomor tidak boleh kembar, melewati kapasitas,
+    # atau hilang karena kiriman ganda yang ditolak.
+    kunci = [(tanggal, sesi, mcu) for tanggal in hari_kerja(3) for sesi in ('Pagi', 'Siang', 'Sore') for mcu in ('Paket A', 'Paket B')]
+    users = [(login(app, f'user{i}'), f'user{i}', kunci[i % len(kunci)]) for i in range(JUMLAH_USER)]
+    kiriman = [user for user in users for _ in range(2)]
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        hasil = list(executor.map(lambda item: daftar(item[0], item[1], *item[2]), kiriman))
+
+    assert all(item['result'] == 'success' or 'sudah habis' in item['message'] or 'sudah mendaftar' in item['message'] for item in hasil)
+    sukses = [item for item in hasil if item['result'] == 'success']
+    assert max(Counter(item['nama'] for item in sukses).values()) == 1
+    for tanggal, sesi, mcu in kunci:
+        tanggal_obj = datetime.strptime(tanggal, '%Y-%m-%d')
+        nomor = [doc['nomor_antrian'] for doc in app.db.antrian.find({'tanggal': tanggal_obj, 'sesi': sesi, 'mcu': mcu})]
+        counter = app.db.antrian_counter.find_one({'_id': app.kunci_antrian(tanggal_obj, sesi, mcu)})
+        kosong = counter.get('kosong', [])
+        assert counter['terisi'] == len(nomor)
+        assert sorted(nomor + kosong) == list(range(1, len(nomor) + len(kosong) + 1))
+        assert len(nomor) + len(kosong) <= app.JADWAL_SESI[sesi.lower()]['kapasitas']
+    assert app.db.antrian.count_documents({}) == len(sukses)
+    assert app.get_statistik()['antrian'] == len(sukses)
+
+
+def test_kiriman_ganda_bersamaan_hanya_satu_yang_tercatat(app, hari_kerja):
+    tanggal = hari_kerja()[0]
+    client = login(app, 'budi')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        hasil = list(executor.map(lambda _: daftar(client, 'budi', tanggal), range(8)))
+
+    assert [item['result'] for item in hasil].count('success') == 1
+    assert all('sudah mendaftar' in item['message'] for item in hasil if item['result'] != 'success')
+    assert app.db.antrian.count_documents({}) == 1
+    assert app.get_statistik()['antrian'] == 1
+    counter = app.db.antrian_counter.find_one()
+    assert counter['terisi'] == 1
+
+
+def test_nomor_yang_dikembalikan_dipakai_lagi(app):
+    tanggal = app.hari_kerja_berikutnya(1)[0]
+    assert [app.alokasi_nomor_antrian(tanggal, 'Pagi', 'Paket A', 4) for _ in range(3)] == [1, 2, 3]
+    app.kembalikan_nomor_antrian(tanggal, 'Pagi', 'Paket A', 2)
+    app.kembalikan_nomor_antrian(tanggal, 'Pagi', 'Paket A', 1)
+    assert [app.alokasi_nomor_antrian(tanggal, 'Pagi', 'Paket A', 4) for _ in range(4)] == [1, 2, 4, None]
@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+FORM_REGISTER = {'nama': 'Budi', 'nik': '3201234567890001', 'gender': '1', 'alamat': 'Bandung'}
+
+
+def test_register_bersamaan_dengan_nik_sama(app):
+    def daftar(_):
+        return app.app.test_client().post('/register', data=FORM_REGISTER)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(daftar, range(8)))
+
+    assert all(response.status_code == 200 for response in responses)
+    hasil = sorted(response.get_json()['message'] for response in responses)
+    assert hasil == ['NIK sudah terdaftar'] * 7 + ['Registrasi berhasil']
+    assert app.db.users.count_documents({}) == 1
+
+
+def test_index_unik_gagal_tidak_menghentikan_startup(app):
+    app.db.users.drop_index('nik_unik')
+    app.db.users.insert_many([{'nama': 'a', 'nik': 'sama'}, {'nama': 'b', 'nik': 'sama'}])
+
+    gagal = app.ensure_indexes()
+    assert [(koleksi, nama) for koleksi, nama, _ in gagal] == [('users', 'nik_unik')]
+
+    result = app.app.test_cli_runner().invoke(args=['nik-ganda'])
+    assert '1 NIK terdaftar lebih dari sekali' in result.output
@@ -0,0 +1,37 @@
+import hashlib
+from datetime import datetime
+
+
+def test_riwayat_melewati_hasil_lama_bertanggal_string(app):
+    user_id = app.db.users.insert_one({'nama': 'budi', 'nik': hashlib.sha256(b'123').hexdigest()}).inserted_id
+    app.db.hasil_mcu.insert_many(
+        [{'user_id': str(user_id), 'tanggal_pemeriksaan': datetime(2024, bulan, 1), 'nama': 'budi'} for bulan in (1, 2, 3)]
+        + [{'user_id': str(user_id), 'tanggal_pemeriksaan': teks, 'nama': 'budi'} for teks in ('05 Mei 2020', '01 Jan 2019')]
+        + [{'user_id': str(user_id), 'nama': 'budi'}]
+    )
+    client = app.app.test_client()
+    client.post('/login', data={'nama': 'budi', 'nik': '123'})
+
+    tanggal, lanjut = [], None
+    while True:
+        response = client.get('/api/hasil_mcu', query_string={'limit': 2, **({'lanjut': lanjut} if lanjut else {})})
+        assert response.status_code == 200
+        body = response.get_json()
+        tanggal += [doc.get('tanggal_pemeriksaan') for doc in body['data']]
+        lanjut = body['lanjut']
+        if not lanjut:
+            break
+
+    assert tanggal == ['2024-03-01', '2024-02-01', '2024-01-01', '05 Mei 2020', '01 Jan 2019', None]
+
+
+def test_token_tanpa_jenis_ditolak(app):
+    import base64
+
+    app.db.users.insert_one({'nama': 'budi', 'nik': hashlib.sha256(b'123').hexdigest()})
+    client = app.app.test_client()
+    client.post('/login', data={'nama': 'budi', 'nik': '123'})
+
+    token = base64.urlsafe_b64encode(f'{datetime(2024, 1, 1).isoformat()}|{"0" * 24}'.encode()).decode()
+    response = client.get('/api/hasil_mcu', query_string={'lanjut': token})
+    assert response.status_code == 400